@@ -13,24 +13,128 @@ import requests
 import plotly.graph_objects as go
 import time
 from oauth2client.service_account import ServiceAccountCredentials
+from sensor_history import HistoryStore, start_compaction_worker
+from irrigation_analysis import UPLOAD_TYPES, IndexedSensorData, load_sensor_file, to_parquet_bytes
+from calibration import CalibrationRegistry, calibrate_dataframe, calibrate_reading
+from alerts import AlertEngine, load_rules, sink_from_environment, start_alert_worker
+from fleet_health import FleetMonitor, fleet_status, histogram_frame, samples_frame
+from pump_accounting import PUMP_ON_BELOW, load_pump_config, pump_usage
+from shared_state import SharedState, start_acquisition
+from playback import SPEEDS, FrameTimeline, HistoryTimeline, Playback
+
+# The IP address of your ESP32 device (SMART_IRRI_ESP32_IP overrides it, e.g. for load tests)
+ESP32_IP = os.environ.get("SMART_IRRI_ESP32_IP", "http://192.168.101.147")  # Replace with your actual IP
+
+# Seconds to wait for the ESP32 before counting the reading as failed
+SENSOR_TIMEOUT = 5
+
+# Charts plot at most this many (evenly spaced) rows, and the data table shows at most TABLE_ROWS
+CHART_ROWS = 5000
+TABLE_ROWS = 10000
+
+# Stop the real-time loop after this many ticks (0 runs forever); used by the load-test harness
+MAX_TICKS = int(os.environ.get("SMART_IRRI_MAX_TICKS", "0"))
+
+# The leader polls the sensor this often; shared readings older than STALE_AFTER count as failed
+ACQUISITION_INTERVAL = 1
+STALE_AFTER = 3
+
+# Seconds between display updates while replaying a timeline
+PLAYBACK_TICK = 0.5
+
+
+# Shared sensor history store, with its background compaction job started once per process
+@st.cache_resource
+def get_history_store():
+    store = HistoryStore()
+    start_compaction_worker(store)
+    return store
+
+
+# Per-node probe calibrations, stored with the sensor history
+@st.cache_resource
+def get_calibrations():
+    return CalibrationRegistry(get_history_store())
+
+
+# Alert rule engine shared by every session, with its timer/flush worker started once per process
+@st.cache_resource
+def get_alert_engine():
+    engine = AlertEngine(load_rules(), sink_from_environment())
+    start_alert_worker(engine)
+    return engine
+
+
+# Per-node request health (latency, failures, last seen) of the requests this process makes; the
+# acquiring replica publishes it for every replica's Fleet Health page
+@st.cache_resource
+def get_fleet_monitor():
+    return FleetMonitor()
 
 
 # Function to read the soil moisture level from Arduino
-def read_soil_moisture():
-    # The IP address of your ESP32 device
-    esp32_ip = "http://192.168.101.147"  # Replace with your actual IP
+def read_soil_moisture(node_url=ESP32_IP):
+    reading = read_sensor(node_url)
+    return None if reading is None else round(reading['soil_moisture'])
+
+
+# Read one node, recording the request's latency and outcome for the Fleet Health page
+def read_sensor(node_url):
+    started = time.perf_counter()
+    reading = fetch_sensor_reading(node_url)
+    get_fleet_monitor().record(node_url, time.perf_counter() - started,
+                               None if reading is None else reading['soil_moisture'])
+    return reading
 
+
+# Request one reading from an ESP32 node, then calibrate, store and evaluate it
+def fetch_sensor_reading(node_url):
     try:
-        response = requests.get(esp32_ip)
+        response = requests.get(node_url, timeout=SENSOR_TIMEOUT)
         if response.status_code == 200:
             data = response.json()  # Get the JSON response
-            soil_moisture = data['soil_moisture']
-            return soil_moisture
+            raw_moisture = data['soil_moisture']
+            temperature = data.get('temperature')
+            # Convert the raw probe value with the node's calibration (if it has one)
+            soil_moisture = calibrate_reading(get_calibrations(), node_url, raw_moisture, temperature)
+            # Keep every reading so it can be rolled up into the long-term history
+            get_history_store().record(node_url, soil_moisture, temperature, data.get('humidity'),
+                                       raw_moisture=raw_moisture)
+            reading = {'soil_moisture': soil_moisture, 'temperature': temperature, 'humidity': data.get('humidity')}
+            get_alert_engine().process_reading(node_url, reading)
+            return reading
         else:
             return None
     except Exception as e:
         return None
 
+
+# One acquisition round, run only by the elected replica: read the sensor, decide the pump and
+# publish both so every replica's sessions show the same values
+def acquisition_step(shared):
+    reading = read_sensor(ESP32_IP)
+    shared.publish_fleet(get_fleet_monitor())
+    if reading is None:
+        return  # Nothing is published, so the shared reading goes stale and sessions show the failure
+
+    # Water Pump Control - Auto mode logic: ON below PUMP_ON_BELOW% moisture, OFF at or above it
+    pump_status = "ON" if reading['soil_moisture'] < PUMP_ON_BELOW else "OFF"
+
+    # Record the status (only while this replica still holds the lease) so the data API, history and
+    # every replica's sessions report it
+    if shared.publish(ESP32_IP, reading, pump_status):
+        get_alert_engine().process_pump(ESP32_IP, pump_status)
+
+
+# Readings and pump state shared by every app replica. Each process joins the leader election
+# once; only the elected one polls the hardware and actuates, the others read what it publishes.
+@st.cache_resource
+def get_shared_state():
+    shared = SharedState(get_history_store())
+    start_acquisition(shared, lambda: acquisition_step(shared), ACQUISITION_INTERVAL)
+    return shared
+
+
 # Helper function to load user data
 def load_users():
     if os.path.exists('users.csv'):
@@ -154,17 +258,22 @@ def main():
         welcome_page()
 
         # Main functionality selection
-        functionality = st.selectbox("Select Functionality", ["Real-Time Control", "Sensor Data Analysis"])
+        functionalities = ["Real-Time Control", "Sensor Data Analysis"]
+        if role == "Maintenance Worker":
+            functionalities.append("Fleet Health")
+        functionality = st.selectbox("Select Functionality", functionalities)
 
         if functionality == "Sensor Data Analysis":
-            sensor_analysis()
+            sensor_analysis(auth_user)
         elif functionality == "Real-Time Control":
             real_time_control()
+        elif functionality == "Fleet Health":
+            fleet_health()
     else:
         if auth_user or auth_pass:
             st.sidebar.error("Invalid username or password!")
 
-def generate_pdf_report(sensor_data, avg_soil_moisture, suggestions, charts, avg_temp, avg_humidity, user_name):
+def generate_pdf_report(sensor_data, avg_soil_moisture, suggestions, charts, avg_temp, avg_humidity, user_name, water_usage=None):
     buffer = BytesIO()
     p = canvas.Canvas(buffer, pagesize=letter)
     width, height = letter
@@ -219,6 +328,24 @@ def generate_pdf_report(sensor_data, avg_soil_moisture, suggestions, charts, avg
         p.drawString(72, y_position, f"- {suggestion}")
         y_position -= 20
 
+    # Pump runtime and estimated water usage per zone and billing month
+    if water_usage is not None and not water_usage.empty:
+        p.showPage()
+        p.setFont("Helvetica", 12)
+        p.drawString(72, height - 72, "Water Usage (pump runtime and estimated litres):")
+        y_position = height - 100
+        for i, row in water_usage.iterrows():
+            if y_position < 72:  # Start a new page if necessary
+                p.showPage()
+                p.setFont("Helvetica", 12)
+                y_position = height - 72
+
+            p.drawString(72, y_position, f"{row['Period']:%Y-%m}  {row['Zone']}: {row['Runtime_Hours']:.2f} h in "
+                                         f"{row['Runs']} runs, {row['Litres']:,.0f} L")
+            y_position -= 20
+        p.drawString(72, y_position - 10, f"Total: {water_usage['Runtime_Hours'].sum():.2f} h, "
+                                          f"{water_usage['Litres'].sum():,.0f} L")
+
     # Save and Add charts to PDF
     for i, chart in enumerate(charts):
         # Save each chart as a PNG image
@@ -238,75 +365,179 @@ def generate_pdf_report(sensor_data, avg_soil_moisture, suggestions, charts, avg
 
 
 
+# Monthly pump runtime and water usage per zone over the report's date range, for the logged-in
+# client's own zones only (None when the pump configuration assigns the client no zones with usage)
+def report_water_usage(start, end, user_name):
+    usage = pump_usage(get_history_store(), load_pump_config(), start, end, freq="MS")
+    usage = usage[usage['Client'] == user_name]
+    if usage.empty:
+        return None
+    return usage.groupby(['Period', 'Zone'], as_index=False)[['Runtime_Hours', 'Litres', 'Runs']].sum()
+
+
+# Keep an expensive result (parsed upload, index, export) in the session until its key changes,
+# so moving a filter reruns the page without redoing the work
+def session_cached(name, key, build):
+    cache = st.session_state.setdefault('analysis_cache', {})
+    if name not in cache or cache[name][0] != key:
+        cache[name] = (key, build())
+    return cache[name][1]
+
+
+# Let the user choose which node's calibration converts the raw probe values in an upload
+def apply_upload_calibration(sensor_data, data_key):
+    registry = get_calibrations()
+    nodes = registry.nodes()
+    if not nodes:
+        st.warning("The file has raw probe values, but no node has a calibration yet. Using Soil_Moisture_Level as-is.")
+        return sensor_data, data_key
+
+    node_id = st.selectbox("Calibrate Raw Values With Node", nodes)
+    calibration = registry.current(node_id)
+    st.caption(f"Using calibration version {calibration.version} ({calibration.kind}) of {node_id}.")
+    data_key = data_key + (node_id, calibration.version)
+    return session_cached('calibrated_data', data_key, lambda: calibrate_dataframe(sensor_data, calibration)), data_key
+
+
+# Let the user pick a node and date range from the stored history, read from the coarsest tier that fits
+def load_stored_history():
+    store = get_history_store()
+    nodes = store.nodes()
+    if not nodes:
+        st.info("No sensor history has been recorded yet.")
+        return None, None
+
+    node_id = st.selectbox("Sensor Node", nodes)
+    first_ts, last_ts = store.time_bounds(node_id)
+    first_day = datetime.datetime.fromtimestamp(first_ts).date()
+    last_day = datetime.datetime.fromtimestamp(last_ts).date()
+    date_range = st.date_input("Date Range", (first_day, last_day), min_value=first_day, max_value=last_day)
+    if len(date_range) != 2:
+        return None, None
+
+    start, end = date_range
+    data_key = ('history', node_id, start, end)
+    sensor_data = session_cached('sensor_data', data_key,
+                                 lambda: store.load(node_id, start, end + datetime.timedelta(days=1)))
+    if sensor_data.empty:
+        st.info("No readings in the selected range.")
+        return None, None
+
+    st.caption(f"Loaded {len(sensor_data)} rows from the '{sensor_data.attrs['tier']}' history tier.")
+    return sensor_data, data_key
+
+
 # Sensor Data Analysis functionality
-def sensor_analysis():
+def sensor_analysis(user_name):
     st.header("Sensor Data Analysis")
     
     # Instructions for the user
     st.markdown("""
     **Instructions:**
-    1. Please upload a CSV file containing your sensor data.
-    2. The CSV file should have the following columns:
+    1. Please upload a file containing your sensor data: CSV (optionally compressed as `.csv.gz` or `.csv.zst`), Parquet, or Feather/Arrow.
+    2. The file should have the following columns:
        - `Datetime`: The combined date and time of the reading.
        - `Soil_Moisture_Level`: The measured soil moisture level (in percentage).
        - `Temperature`: The temperature at the time of reading (in Celsius).
        - `Humidity`: The humidity at the time of reading (in percentage).
     3. Once the file is uploaded, the system will analyze the data and provide insights and recommendations.
     4. After reviewing the analysis, you can generate a report by clicking the button below.
+    5. Alternatively, choose "Stored History" to analyse readings recorded by your sensor nodes.
+    6. Files may also include a `Raw_Soil_Moisture` column of uncalibrated probe values; these are converted with a node's calibration.
+    7. Use the Date Range slider (and, if the file has a `Zone` column, the Zones filter) to narrow the analysis.
     """)
-    
-    uploaded_file = st.file_uploader("Upload Sensor Data (CSV)", type="csv")
+
+    data_source = st.radio("Data Source", ["Upload File", "Stored History"], horizontal=True)
+    sensor_data = None
+
+    if data_source == "Upload File":
+        uploaded_file = st.file_uploader("Upload Sensor Data (CSV, Parquet, Feather)", type=UPLOAD_TYPES)
+
+        if uploaded_file:
+            # Read the uploaded file once (only the sensor columns are loaded); reruns reuse it
+            data_key = ('upload', uploaded_file.name, uploaded_file.size, getattr(uploaded_file, 'file_id', None))
+            try:
+                sensor_data = session_cached('sensor_data', data_key, lambda: load_sensor_file(uploaded_file))
+            except (ValueError, OSError) as error:
+                st.error(f"Could not read {uploaded_file.name}: {error}")
+                return
+
+            # Files with raw probe values are converted with the chosen node's calibration
+            if 'Raw_Soil_Moisture' in sensor_data.columns:
+                sensor_data, data_key = apply_upload_calibration(sensor_data, data_key)
+    else:
+        sensor_data, data_key = load_stored_history()
 
     # Inside sensor_analysis function
-    if uploaded_file:
-        # Read the CSV file
-        sensor_data = pd.read_csv(uploaded_file)
+    if sensor_data is not None:
+        # Sort and index the dataset once, so the filters below only do binary searches
+        indexed = session_cached('indexed_data', data_key, lambda: IndexedSensorData(sensor_data))
+        if indexed.empty:
+            st.info("The dataset has no dated readings to analyze.")
+            return
+        first, last = indexed.bounds()
+
+        # Date-range and zone filters
+        if first < last:
+            start, end = st.slider("Date Range", min_value=first.to_pydatetime(), max_value=last.to_pydatetime(),
+                                   value=(first.to_pydatetime(), last.to_pydatetime()), format="YYYY-MM-DD HH:mm")
+        else:
+            start, end = first, last
+        zones = None
+        if indexed.zones:
+            zones = st.multiselect("Zones", indexed.zones, default=indexed.zones)
 
-        # Convert the Datetime column to datetime format
-        sensor_data['Datetime'] = pd.to_datetime(sensor_data['Datetime'])
+        row_count = indexed.count(start, end, zones)
+        if row_count == 0:
+            st.info("No readings in the selected range.")
+            return
+        chart_data = indexed.slice(start, end, zones, max_rows=CHART_ROWS)
 
         # Display the uploaded data
-        st.write(sensor_data)
+        st.write(indexed.slice(start, end, zones, limit=TABLE_ROWS))
+        if row_count > TABLE_ROWS:
+            st.caption(f"Showing the first {TABLE_ROWS} of {row_count} rows.")
+
+        # Export the normalized dataset (parsed dates, calibrated moisture) for reuse
+        parquet_bytes = session_cached('parquet_export', data_key, lambda: to_parquet_bytes(indexed.slice(first, last)))
+        st.download_button("Export as Parquet", parquet_bytes, "sensor_data.parquet", "application/vnd.apache.parquet")
+
+        # Charts get a zone colour when several zones are shown
+        zone_color = {'color': 'Zone:N'} if zones and len(zones) > 1 else {}
 
         # Visualizations
-        soil_moisture_chart = alt.Chart(sensor_data).mark_line().encode(
+        soil_moisture_chart = alt.Chart(chart_data).mark_line().encode(
             x='Datetime:T',
-            y='Soil_Moisture_Level:Q'
+            y='Soil_Moisture_Level:Q',
+            **zone_color
         ).properties(title="Soil Moisture Level Monitoring Over Time")
 
-        temperature_chart = alt.Chart(sensor_data).mark_line(color='red').encode(
+        temperature_chart = alt.Chart(chart_data).mark_line(color='red').encode(
             x='Datetime:T',
-            y='Temperature:Q'
+            y='Temperature:Q',
+            **zone_color
         ).properties(title="Temperature Monitoring Over Time")
 
-        humidity_chart = alt.Chart(sensor_data).mark_line(color='blue').encode(
+        humidity_chart = alt.Chart(chart_data).mark_line(color='blue').encode(
             x='Datetime:T',
-            y='Humidity:Q'
+            y='Humidity:Q',
+            **zone_color
         ).properties(title="Humidity Monitoring Over Time")
 
-        moisture_histogram = alt.Chart(sensor_data).mark_bar().encode(
+        moisture_histogram = alt.Chart(chart_data).mark_bar().encode(
             alt.X('Soil_Moisture_Level:Q', bin=True),
             y='count()'
         ).properties(title="Distribution of Soil Moisture Levels")
 
 
-        # Average calculations
-        avg_temp = sensor_data['Temperature'].mean()
-        avg_humidity = sensor_data['Humidity'].mean()
-
-        # Suggestions
-        avg_soil_moisture = sensor_data['Soil_Moisture_Level'].mean()
-        suggestions = []
-        if avg_soil_moisture < 21:
-            suggestions.append("Very low soil moisture! Immediate irrigation is recommended.")
-        elif avg_soil_moisture < 41:
-            suggestions.append("Low soil moisture. Consider increasing irrigation frequency.")
-        elif avg_soil_moisture < 71:
-            suggestions.append("Optimal soil moisture levels. Continue current irrigation practices.")
-        else:
-            suggestions.append("High soil moisture. Reduce irrigation to avoid overwatering.")
+        # Average calculations and suggestions, from the index's running sums
+        summary = indexed.summary(start, end, zones)
+        avg_temp = summary['avg_temp']
+        avg_humidity = summary['avg_humidity']
+        avg_soil_moisture = summary['avg_soil_moisture']
+        suggestions = summary['suggestions']
 
-        total_performance_chart = alt.Chart(sensor_data).transform_fold(
+        total_performance_chart = alt.Chart(chart_data).transform_fold(
             ['Soil_Moisture_Level', 'Temperature', 'Humidity'],  # Columns to fold (combine)
             as_=['Metric', 'Value']  # Metric will be used to distinguish between soil moisture, temperature, and humidity
         ).mark_line().encode(
@@ -329,7 +560,6 @@ def sensor_analysis():
         st.write(f"Average Humidity: {avg_humidity:.2f}%")
 
         # Button to generate report
-        user_name = "Farmer John"  # Replace with user input if necessary
         if st.button("Generate Report"):
             # Include all charts
             charts = [
@@ -339,96 +569,263 @@ def sensor_analysis():
                 moisture_histogram,
                 total_performance_chart  # Add Total Performance chart
             ]
-            pdf_buffer = generate_pdf_report(sensor_data, avg_soil_moisture, suggestions, charts, avg_temp, avg_humidity, user_name=user_name)
+            sensor_data = indexed.slice(start, end, zones)
+            water_usage = report_water_usage(start, end, user_name)
+            pdf_buffer = generate_pdf_report(sensor_data, avg_soil_moisture, suggestions, charts, avg_temp, avg_humidity,
+                                             user_name=user_name, water_usage=water_usage)
             st.download_button("Download PDF Report", pdf_buffer, "sensor_data_report.pdf", "application/pdf")
 
 
 
+# Fleet Health functionality (Maintenance Worker): which nodes are slow, flaky or offline
+def fleet_health():
+    st.header("Fleet Health")
+
+    # Request health as published by the replica that polls the sensors, so every replica shows it
+    shared = get_shared_state()
+    fleet = fleet_status(shared.fleet())
+    if fleet.empty:
+        st.info("No sensor nodes have been polled yet.")
+        return
+
+    # Fleet overview
+    status_counts = fleet['Status'].value_counts()
+    columns = st.columns(4)
+    for column, status in zip(columns, ["Healthy", "Slow", "Flaky", "Offline"]):
+        column.metric(status, int(status_counts.get(status, 0)))
+
+    # Filter and sort
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        all_statuses = ["Offline", "Flaky", "Slow", "Healthy"]
+        statuses = st.multiselect("Status", all_statuses, default=all_statuses)
+    with col2:
+        search = st.text_input("Node contains")
+    with col3:
+        sort_by = st.selectbox("Sort by", ["Latency_p99_ms", "Failure_Rate", "Seconds_Since_Seen", "Moisture_Variance", "Node"])
+
+    shown = fleet[fleet['Status'].isin(statuses)]
+    if search:
+        shown = shown[shown['Node'].str.contains(search, case=False, regex=False)]
+    shown = shown.sort_values(sort_by, ascending=(sort_by == "Node"), na_position='last')
+    st.dataframe(shown, use_container_width=True, hide_index=True)
+
+    # Drill down into one node's recent raw samples; any node can be inspected, the filtered ones first
+    nodes = list(shown['Node']) + [node for node in fleet['Node'] if node not in set(shown['Node'])]
+    node_id = st.selectbox("Inspect Node", nodes)
+    samples = samples_frame(shared.fleet_samples(node_id))
+    moisture_chart = alt.Chart(samples).mark_line(point=True).encode(
+        x='Datetime:T',
+        y='Soil_Moisture_Level:Q'
+    ).properties(title=f"Recent Readings of {node_id}")
+    latency_chart = alt.Chart(samples).mark_bar().encode(
+        x='Datetime:T',
+        y='Latency_ms:Q',
+        color=alt.Color('OK:N', scale=alt.Scale(domain=[True, False], range=['green', 'red']))
+    ).properties(title="Request Latency (ms)")
+    histogram = histogram_frame(shared.fleet_histogram(node_id))
+    histogram_chart = alt.Chart(histogram[histogram['Requests'] > 0]).mark_bar().encode(
+        x=alt.X('Upper_Bound_ms:O', title="Latency up to (ms)", axis=alt.Axis(format='.1f')),
+        y='Requests:Q'
+    ).properties(title="Latency Distribution Since Start")
+    st.altair_chart(moisture_chart, use_container_width=True)
+    st.altair_chart(latency_chart, use_container_width=True)
+    st.altair_chart(histogram_chart, use_container_width=True)
+    st.dataframe(samples.iloc[::-1], use_container_width=True, hide_index=True)
+
+
 # Add session state variables for the auto-control
 if 'water_pump_status' not in st.session_state:
     st.session_state.water_pump_status = "OFF"  # Initial status of the water pump
 if 'water_pump_status_displayed' not in st.session_state:
     st.session_state.water_pump_status_displayed = False  # Track if the status display was already created
 
+# Let the user pick a stored or uploaded timeline and control its playback; returns the Playback (or None)
+def playback_controls():
+    timeline_source = st.radio("Timeline", ["Stored History", "Upload File"], horizontal=True)
+    if timeline_source == "Stored History":
+        store = get_history_store()
+        nodes = store.nodes()
+        if not nodes:
+            st.info("No sensor history has been recorded yet.")
+            return None
+        node_id = st.selectbox("Sensor Node", nodes, key='playback_node')
+        timeline_key = ('history', node_id)
+        build_timeline = lambda: HistoryTimeline(store, node_id)
+    else:
+        uploaded_file = st.file_uploader("Upload Sensor Data (CSV, Parquet, Feather)", type=UPLOAD_TYPES,
+                                         key='playback_upload')
+        if not uploaded_file:
+            return None
+        timeline_key = ('upload', uploaded_file.name, uploaded_file.size, getattr(uploaded_file, 'file_id', None))
+        build_timeline = lambda: FrameTimeline(load_sensor_file(uploaded_file))
+
+    # Keep one player per session, replaced (and its reader stopped) when the timeline changes
+    playback = st.session_state.get('playback')
+    if playback is None or st.session_state.get('playback_key') != timeline_key:
+        if playback is not None:
+            playback.close()
+            st.session_state.playback = None
+        try:
+            playback = Playback(build_timeline())
+        except (ValueError, OSError) as error:
+            st.error(f"Could not read the timeline: {error}")
+            return None
+        st.session_state.playback, st.session_state.playback_key = playback, timeline_key
+        st.session_state.playback_seek = None
+    if playback.first is None:
+        st.info("The timeline has no readings.")
+        return None
+
+    first_day = datetime.datetime.fromtimestamp(playback.first).date()
+    last_day = datetime.datetime.fromtimestamp(playback.last).date()
+    col1, col2, col3 = st.columns(3)
+    day = col1.date_input("Day", first_day, min_value=first_day, max_value=last_day, key='playback_day')
+    time_of_day = col2.time_input("Time", datetime.time(0, 0), step=60, key='playback_time')
+    speed = col3.select_slider("Speed", SPEEDS, value=1, format_func=lambda speed: f"{speed}×", key='playback_speed')
+
+    # Seek only when the chosen day/time changes, not on every rerun
+    if st.session_state.playback_seek != (day, time_of_day):
+        playback.seek(datetime.datetime.combine(day, time_of_day).timestamp())
+        st.session_state.playback_seek = (day, time_of_day)
+    playback.set_speed(speed)
+
+    col_play, col_pause = st.columns(2)
+    if col_play.button("▶ Play", use_container_width=True):
+        playback.play()
+    if col_pause.button("⏸ Pause", use_container_width=True):
+        playback.pause()
+    return playback
+
+
+# Show a moisture level and pump status in the gauge and status displays
+def show_moisture_status(soil_moisture_display, soil_moisture_value_display, soil_moisture_chart_display,
+                         soil_moisture_level, water_pump_status):
+    # Display the current soil moisture level using a slider (disabled for display purposes)
+    key = f"soil_moisture_slider_{soil_moisture_level}_{time.time()}"
+    soil_moisture_display.slider("Current Soil Moisture Level", 0, 100, soil_moisture_level, key=key, disabled=True)
+
+    # Create centered layout
+    col1, col2, col3 = st.columns([1, 3, 1])  # Adjust column widths to center content
+
+    with col2:  # Center the content in the middle column
+        if not hasattr(st.session_state, 'label_displayed'):  # Display label once
+            st.markdown("<h3 style='text-align: center;'>Soil Moisture Level</h3>", unsafe_allow_html=True)
+            st.session_state.label_displayed = True
+
+        # Dynamically update the value display
+        soil_moisture_value_display.empty()  # Clear previous value
+        soil_moisture_value_display.markdown(f"<h1 style='text-align: center; font-size: 60px;'>{soil_moisture_level}%</h1>", unsafe_allow_html=True)
+
+    # Create the car-meter style gauge chart
+    fig = go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=soil_moisture_level,
+        title={'text': "Soil Moisture Level"},
+        gauge={'axis': {'range': [0, 100]},
+               'bar': {'color': "lightblue"},
+               'steps': [
+                   {'range': [0, 20], 'color': "red"},
+                   {'range': [20, 50], 'color': "yellow"},
+                   {'range': [50, 100], 'color': "green"}],
+               'threshold': {'line': {'color': "blue", 'width': 4}, 'thickness': 0.75, 'value': soil_moisture_level}}))
+
+    # Update the chart dynamically using the placeholder
+    chart_key = f"soil_moisture_chart_{time.time()}"
+    soil_moisture_chart_display.plotly_chart(fig, use_container_width=True, key=chart_key)
+
+    # Water Pump Status Display Section - Display it once, then only update status dynamically
+    if not st.session_state.water_pump_status_displayed:
+        st.session_state.water_pump_status_displayed = True  # Track that we've displayed the status section once
+
+        # Placeholder for the status display
+        st.session_state.water_pump_status_placeholder = st.empty()
+
+    # Dynamically update the status display only when water pump status changes
+    pump_emoji = "💧" if water_pump_status == "ON" else "🚫💧"
+    pump_status_color = "green" if water_pump_status == "ON" else "red"
+
+    # Update the water pump status display dynamically in the placeholder
+    st.session_state.water_pump_status_placeholder.markdown(
+        f"<h3 style='text-align:center; color:{pump_status_color}; font-size: 30px;'>{pump_emoji} Water Pump Status</h3>"
+        f"<h1 style='text-align: center; font-size: 80px;'>{water_pump_status}</h1>",
+        unsafe_allow_html=True
+    )
+
+
 # Real-Time Control functionality
 def real_time_control():
     st.header("Soil Moisture Monitoring")
 
+    # Live shows the sensor now; Playback replays a stored or uploaded timeline through the same displays
+    mode = st.radio("Mode", ["Live", "Playback"], horizontal=True)
+    playback = None
+    if mode == "Playback":
+        playback = playback_controls()
+        if playback is None:
+            return
+        playback_status = st.empty()
+    elif st.session_state.get('playback') is not None:
+        # Back to live: stop the player's reader and let go of its timeline
+        st.session_state.playback.close()
+        st.session_state.playback = st.session_state.playback_key = None
+
+    # The status placeholder is created on each run, below the controls
+    st.session_state.water_pump_status_displayed = False
+
     # Initialize the placeholders for real-time updates
     soil_moisture_display = st.empty()
     soil_moisture_value_display = st.empty()
     soil_moisture_chart_display = st.empty()
 
-    while True:
-        # Get the real-time soil moisture level from Arduino
-        soil_moisture_level = read_soil_moisture()
+    # Recent tick durations (excluding the wait between ticks), read by the load-test harness
+    if 'tick_latencies' not in st.session_state:
+        st.session_state.tick_latencies = []
+    ticks = 0
 
-        if soil_moisture_level is not None:
-            # Display the current soil moisture level using a slider (disabled for display purposes)
-            key = f"soil_moisture_slider_{soil_moisture_level}_{int(time.time())}"
-            soil_moisture_display.slider("Current Soil Moisture Level", 0, 100, soil_moisture_level, key=key, disabled=True)
-
-            # Create centered layout
-            col1, col2, col3 = st.columns([1, 3, 1])  # Adjust column widths to center content
-
-            with col2:  # Center the content in the middle column
-                if not hasattr(st.session_state, 'label_displayed'):  # Display label once
-                    st.markdown("<h3 style='text-align: center;'>Soil Moisture Level</h3>", unsafe_allow_html=True)
-                    st.session_state.label_displayed = True
-
-                # Dynamically update the value display
-                soil_moisture_value_display.empty()  # Clear previous value
-                soil_moisture_value_display.markdown(f"<h1 style='text-align: center; font-size: 60px;'>{soil_moisture_level}%</h1>", unsafe_allow_html=True)
-
-            # Create the car-meter style gauge chart
-            fig = go.Figure(go.Indicator(
-                mode="gauge+number",
-                value=soil_moisture_level,
-                title={'text': "Soil Moisture Level"},
-                gauge={'axis': {'range': [0, 100]},
-                       'bar': {'color': "lightblue"},
-                       'steps': [
-                           {'range': [0, 20], 'color': "red"},
-                           {'range': [20, 50], 'color': "yellow"},
-                           {'range': [50, 100], 'color': "green"}],
-                       'threshold': {'line': {'color': "blue", 'width': 4}, 'thickness': 0.75, 'value': soil_moisture_level}}))
-
-            # Update the chart dynamically using the placeholder
-            chart_key = f"soil_moisture_chart_{int(time.time())}"
-            soil_moisture_chart_display.plotly_chart(fig, use_container_width=True, key=chart_key)
-
-            # Water Pump Control - Auto mode logic
-            if soil_moisture_level < 50:
-                # Automatically turn the water pump ON if moisture is below 50%
-                st.session_state.water_pump_status = "ON"
+    while True:
+        tick_started = time.perf_counter()
+
+        if playback is None:
+            # Get the latest soil moisture level and pump status published by the acquiring replica
+            state = get_shared_state().current(ESP32_IP)
+            if state is not None and time.time() - state['ts'] <= STALE_AFTER:
+                soil_moisture_level = round(state['soil_moisture'])
+                st.session_state.water_pump_status = state['pump_status']
             else:
-                # Automatically turn the water pump OFF if moisture is 50% or higher
-                st.session_state.water_pump_status = "OFF"
-
-            # Water Pump Status Display Section - Display it once, then only update status dynamically
-            if not st.session_state.water_pump_status_displayed:
-                st.session_state.water_pump_status_displayed = True  # Track that we've displayed the status section once
-
-                # Placeholder for the status display
-                st.session_state.water_pump_status_placeholder = st.empty()
-
-            # Dynamically update the status display only when water pump status changes
-            pump_emoji = "💧" if st.session_state.water_pump_status == "ON" else "🚫💧"
-            pump_status_color = "green" if st.session_state.water_pump_status == "ON" else "red"
-
-            # Update the water pump status display dynamically in the placeholder
-            st.session_state.water_pump_status_placeholder.markdown(
-                f"<h3 style='text-align:center; color:{pump_status_color}; font-size: 30px;'>{pump_emoji} Water Pump Status</h3>"
-                f"<h1 style='text-align: center; font-size: 80px;'>{st.session_state.water_pump_status}</h1>",
-                unsafe_allow_html=True
-            )
+                soil_moisture_level = None
+            water_pump_status = st.session_state.water_pump_status
+        else:
+            # The reading and pump status at the playback position
+            frame = playback.frame()
+            soil_moisture_level = None
+            if frame is not None:
+                if pd.notna(frame['soil_moisture']):
+                    soil_moisture_level = round(frame['soil_moisture'])
+                water_pump_status = frame['pump_status']
+                position = datetime.datetime.fromtimestamp(frame['position'])
+                playback_status.caption(
+                    f"Replaying {position:%Y-%m-%d %H:%M:%S} at {playback.speed}×"
+                    + (" (paused)" if not playback.playing else "")
+                    + (" (buffering…)" if frame['buffering'] else "")
+                )
 
+        if soil_moisture_level is not None:
+            show_moisture_status(soil_moisture_display, soil_moisture_value_display, soil_moisture_chart_display,
+                                 soil_moisture_level, water_pump_status)
+        elif playback is not None:
+            soil_moisture_display.info("No reading at this point of the timeline.")
         else:
             # Display an error message if data could not be fetched
             soil_moisture_display.error("Failed to read data from the sensor.")
 
-        # Refresh the page every 1 second to simulate real-time data fetching
-        time.sleep(1)
+        st.session_state.tick_latencies = st.session_state.tick_latencies[-999:] + [time.perf_counter() - tick_started]
+        ticks += 1
+        if MAX_TICKS and ticks >= MAX_TICKS:
+            break
+
+        # Refresh the page every second (more often during playback) to simulate real-time data fetching
+        time.sleep(1 if playback is None else PLAYBACK_TICK)
 
     
 # Run the application
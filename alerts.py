@@ -0,0 +1,300 @@
+import heapq
+import json
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+import requests
+
+
+# Default location of the user-defined alert rules (SMART_IRRI_ALERT_RULES overrides it)
+ALERT_RULES_FILE = os.environ.get("SMART_IRRI_ALERT_RULES", "alert_rules.json")
+
+# Where alerts go when no SMTP server or webhook is configured
+ALERT_LOG = "alerts.jsonl"
+
+# Most alerts kept for delivery while the sink is failing; the oldest are dropped beyond this
+MAX_PENDING = 10_000
+
+# Seconds an SMTP connection may block before the delivery is retried later
+SMTP_TIMEOUT = 10
+
+# Metrics a reading can carry, plus the pseudo-metrics used by offline and pump rules
+READING_METRICS = ("soil_moisture", "temperature", "humidity")
+
+# Rules used until the user writes their own rules file
+DEFAULT_RULES = [
+    {"rule_id": "low-moisture", "metric": "soil_moisture", "condition": "below", "threshold": 20, "duration": 600},
+    {"rule_id": "sensor-offline", "metric": "reading", "condition": "offline", "duration": 60},
+    {"rule_id": "pump-on-too-long", "metric": "pump", "condition": "on_for", "duration": 3600},
+]
+
+
+# One user-defined alert condition.
+#   below/above: metric below/above threshold continuously for duration seconds
+#   offline:     no reading from the node for duration seconds (metric "reading")
+#   on_for:      pump ON continuously for duration seconds (metric "pump")
+# node_id None applies the rule to every node.
+class AlertRule:
+    CONDITIONS = ("below", "above", "offline", "on_for")
+
+    def __init__(self, rule_id, metric, condition, duration=0, threshold=None, node_id=None, message=None):
+        if condition not in self.CONDITIONS:
+            raise ValueError(f"Unknown alert condition: {condition}")
+        if condition in ("below", "above") and (metric not in READING_METRICS or threshold is None):
+            raise ValueError(f"Rule {rule_id}: '{condition}' needs a threshold and one of {READING_METRICS}")
+        if condition == "offline":
+            metric = "reading"
+        if condition == "on_for":
+            metric = "pump"
+        self.rule_id = rule_id
+        self.metric = metric
+        self.condition = condition
+        self.duration = float(duration)
+        self.threshold = threshold
+        self.node_id = node_id
+        self.message = message
+
+    def describe(self, node_id):
+        if self.message:
+            return self.message.format(node_id=node_id, threshold=self.threshold, duration=self.duration)
+        if self.condition == "offline":
+            return f"{node_id} has sent no readings for {self.duration:.0f}s"
+        if self.condition == "on_for":
+            return f"Pump at {node_id} has been ON for over {self.duration:.0f}s"
+        return f"{self.metric} at {node_id} {self.condition} {self.threshold} for {self.duration:.0f}s"
+
+
+# Helper function to load rules from a JSON file (a list of rule objects), falling back to the defaults
+def load_rules(path=ALERT_RULES_FILE):
+    if os.path.exists(path):
+        with open(path) as rules_file:
+            definitions = json.load(rules_file)
+    else:
+        definitions = DEFAULT_RULES
+    return [AlertRule(**definition) for definition in definitions]
+
+
+# Appends alerts as JSON lines to a local file
+class FileSink:
+    def __init__(self, path=ALERT_LOG):
+        self.path = path
+
+    def send(self, alerts):
+        with open(self.path, "a") as log:
+            for alert in alerts:
+                log.write(json.dumps(alert) + "\n")
+
+
+# Posts each batch of alerts as JSON to a webhook
+class WebhookSink:
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, alerts):
+        requests.post(self.url, json={"alerts": alerts}, timeout=self.timeout).raise_for_status()
+
+
+# Emails each batch of alerts through an SMTP server (a local relay or a test stand-in)
+class SMTPSink:
+    def __init__(self, host, port, sender, recipients, timeout=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.timeout = timeout
+
+    def send(self, alerts):
+        message = EmailMessage()
+        message["Subject"] = f"SMART IRRI: {len(alerts)} alert(s)"
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message.set_content("\n".join(
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(alert['ts']))}  {alert['message']}"
+            for alert in alerts
+        ))
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(message)
+
+
+# Pick the sink from the environment: SMART_IRRI_ALERT_WEBHOOK, SMART_IRRI_SMTP_HOST, else the local log file
+def sink_from_environment():
+    if os.environ.get("SMART_IRRI_ALERT_WEBHOOK"):
+        return WebhookSink(os.environ["SMART_IRRI_ALERT_WEBHOOK"])
+    if os.environ.get("SMART_IRRI_SMTP_HOST"):
+        return SMTPSink(
+            os.environ["SMART_IRRI_SMTP_HOST"],
+            int(os.environ.get("SMART_IRRI_SMTP_PORT", "25")),
+            os.environ.get("SMART_IRRI_ALERT_FROM", "smart-irri@localhost"),
+            os.environ.get("SMART_IRRI_ALERT_TO", "root@localhost").split(","),
+        )
+    return FileSink()
+
+
+# Evaluates rules on every incoming reading. Rules are indexed by (node, metric), so a reading only
+# touches the rules that can match it; offline and pump timers sit in a deadline heap.
+# Each (rule, node) fires once per episode and re-arms when the condition clears.
+# Evaluation only queues alerts; the worker thread (start_alert_worker) is the only one that talks to
+# the sink, so a slow or unreachable sink never holds up the acquisition loop.
+class AlertEngine:
+    def __init__(self, rules, sink, batch_size=100, batch_interval=5.0, max_pending=MAX_PENDING):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.index = {}
+        self.rules = {}
+        for rule in rules:
+            self.add_rule(rule)
+
+        self.condition_since = {}  # (rule_id, node_id) -> time the condition became true
+        self.active = set()  # (rule_id, node_id) pairs that already fired in the current episode
+        self.last_seen = {}
+        self.pump_on_since = {}
+        self.deadlines = []  # heap of (due, rule_id, node_id)
+        self.scheduled = set()
+        self.pending = []
+        self.dropped = 0  # Alerts dropped because the queue was full
+        self.last_flush = time.time()
+
+    def add_rule(self, rule):
+        with self.lock:
+            self.rules[rule.rule_id] = rule
+            self.index.setdefault((rule.node_id, rule.metric), []).append(rule)
+
+    def _matching(self, node_id, metric):
+        return self.index.get((node_id, metric), []) + self.index.get((None, metric), [])
+
+    def _fire(self, rule, node_id, now, value=None):
+        key = (rule.rule_id, node_id)
+        if key in self.active:
+            return
+        self.active.add(key)
+        self.pending.append({
+            "rule_id": rule.rule_id, "node_id": node_id, "metric": rule.metric,
+            "value": value, "ts": now, "message": rule.describe(node_id),
+        })
+        self._trim()
+
+    # Drop the oldest queued alerts beyond max_pending (called with the lock held)
+    def _trim(self):
+        overflow = len(self.pending) - self.max_pending
+        if overflow > 0:
+            del self.pending[:overflow]
+            self.dropped += overflow
+
+    def _clear(self, rule, node_id):
+        key = (rule.rule_id, node_id)
+        self.condition_since.pop(key, None)
+        self.active.discard(key)
+
+    def _schedule(self, rule, node_id, due):
+        key = (rule.rule_id, node_id)
+        if key not in self.scheduled:
+            self.scheduled.add(key)
+            heapq.heappush(self.deadlines, (due, rule.rule_id, node_id))
+
+    # Evaluate one reading, e.g. {"soil_moisture": 18, "temperature": 30.5, "humidity": 70}
+    def process_reading(self, node_id, reading, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self.last_seen[node_id] = now
+            for rule in self._matching(node_id, "reading"):
+                self._clear(rule, node_id)
+                self._schedule(rule, node_id, now + rule.duration)
+
+            for metric in READING_METRICS:
+                value = reading.get(metric)
+                if value is None:
+                    continue
+                for rule in self._matching(node_id, metric):
+                    breached = value < rule.threshold if rule.condition == "below" else value > rule.threshold
+                    if not breached:
+                        self._clear(rule, node_id)
+                        continue
+                    since = self.condition_since.setdefault((rule.rule_id, node_id), now)
+                    if now - since >= rule.duration:
+                        self._fire(rule, node_id, now, value)
+
+    # Track a pump status change ("ON"/"OFF")
+    def process_pump(self, node_id, status, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            if status == "ON":
+                if node_id not in self.pump_on_since:
+                    self.pump_on_since[node_id] = now
+                    for rule in self._matching(node_id, "pump"):
+                        self._schedule(rule, node_id, now + rule.duration)
+            else:
+                self.pump_on_since.pop(node_id, None)
+                for rule in self._matching(node_id, "pump"):
+                    self._clear(rule, node_id)
+
+    # Fire offline and pump timers that are due; call periodically (the worker thread does)
+    def tick(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            while self.deadlines and self.deadlines[0][0] <= now:
+                _, rule_id, node_id = heapq.heappop(self.deadlines)
+                self.scheduled.discard((rule_id, node_id))
+                rule = self.rules[rule_id]
+                if rule.condition == "offline":
+                    since = self.last_seen[node_id]
+                else:
+                    since = self.pump_on_since.get(node_id)
+                    if since is None:
+                        continue  # Pump went OFF before the deadline
+                if now - since >= rule.duration:
+                    self._fire(rule, node_id, now)
+                else:
+                    self._schedule(rule, node_id, since + rule.duration)
+
+    # Hand over the queued alerts once the batch is full or old enough (called with the lock held)
+    def _take_batch(self, now, force=False):
+        if not self.pending:
+            return None
+        if not force and len(self.pending) < self.batch_size and now - self.last_flush < self.batch_interval:
+            return None
+        batch, self.pending = self.pending, []
+        self.last_flush = now
+        return batch
+
+    # Deliver outside the lock so a slow sink never holds up reading evaluation
+    def _send(self, batch):
+        if not batch:
+            return
+        try:
+            self.sink.send(batch)
+        except (OSError, requests.RequestException):
+            with self.lock:
+                self.pending = batch + self.pending  # Keep them for the next flush
+                self._trim()
+
+    # Send the queued alerts once the batch is full or old enough (the worker thread calls this)
+    def deliver(self, now=None):
+        with self.lock:
+            batch = self._take_batch(time.time() if now is None else now)
+        self._send(batch)
+
+    # Send any queued alerts now
+    def flush(self, now=None):
+        with self.lock:
+            batch = self._take_batch(time.time() if now is None else now, force=True)
+        self._send(batch)
+
+
+# Start the background thread that fires timed rules and delivers batches to the sink
+def start_alert_worker(engine, interval=1.0):
+    stop_event = threading.Event()
+
+    def run():
+        while not stop_event.wait(interval):
+            engine.tick()
+            engine.deliver()
+
+    threading.Thread(target=run, name="alert-engine", daemon=True).start()
+    return stop_event
@@ -0,0 +1,240 @@
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from sensor_history import HISTORY_DB, TIERS, HistoryStore
+
+
+# Rows converted per batch when re-calibrating stored raw readings
+RECALIBRATION_CHUNK = 200_000
+
+
+# A probe calibration: maps raw probe values to moisture percentages.
+# kind "piecewise" takes params {"points": [[raw, percent], ...]} (a dry/wet pair is the simplest case),
+# kind "polynomial" takes params {"coefficients": [...]} in numpy.polyval order (highest power first).
+# Raw values are temperature-compensated first: raw - temp_coeff * (temperature - ref_temp).
+class Calibration:
+    def __init__(self, node_id, version, kind, params, temp_coeff=0.0, ref_temp=25.0, created=None):
+        if kind not in ("piecewise", "polynomial"):
+            raise ValueError(f"Unknown calibration kind: {kind}")
+        self.node_id = node_id
+        self.version = version
+        self.kind = kind
+        self.params = params
+        self.temp_coeff = temp_coeff
+        self.ref_temp = ref_temp
+        self.created = created
+
+        if kind == "piecewise":
+            points = np.array(sorted(params["points"]), dtype=float)
+            if len(points) < 2:
+                raise ValueError("A piecewise calibration needs at least two points")
+            self._raw_points = points[:, 0]
+            self._percent_points = points[:, 1]
+        else:
+            self._coefficients = np.asarray(params["coefficients"], dtype=float)
+
+    # Convert a whole batch of raw readings (NumPy arrays or pandas Series) to moisture percentages
+    def apply(self, raw, temperature=None):
+        raw = np.asarray(raw, dtype=float)
+        if self.temp_coeff and temperature is not None:
+            temperature = np.asarray(temperature, dtype=float)
+            # Readings without a temperature are left uncompensated
+            raw = raw - self.temp_coeff * np.nan_to_num(temperature - self.ref_temp)
+
+        if self.kind == "piecewise":
+            percent = np.interp(raw, self._raw_points, self._percent_points)
+        else:
+            percent = np.polyval(self._coefficients, raw)
+        return np.clip(percent, 0, 100)
+
+    # Convert a single live reading
+    def apply_one(self, raw, temperature=None):
+        return float(self.apply([raw], None if temperature is None else [temperature])[0])
+
+
+# Versioned calibrations per sensor node, kept alongside the sensor history
+class CalibrationRegistry:
+    def __init__(self, store):
+        self.store = store
+        with store.lock, store.conn:
+            store.conn.execute(
+                "CREATE TABLE IF NOT EXISTS calibrations ("
+                "node_id TEXT NOT NULL, version INTEGER NOT NULL, created REAL NOT NULL, kind TEXT NOT NULL, "
+                "params TEXT NOT NULL, temp_coeff REAL NOT NULL, ref_temp REAL NOT NULL, "
+                "PRIMARY KEY (node_id, version))"
+            )
+
+    def _from_row(self, row):
+        node_id, version, created, kind, params, temp_coeff, ref_temp = row
+        return Calibration(node_id, version, kind, json.loads(params), temp_coeff, ref_temp, created)
+
+    # Record a new calibration for a node; returns it with its new version number
+    def record(self, node_id, kind, params, temp_coeff=0.0, ref_temp=25.0):
+        with self.store.lock, self.store.conn:
+            row = self.store.conn.execute(
+                "SELECT MAX(version) FROM calibrations WHERE node_id = ?", (node_id,)
+            ).fetchone()
+            version = (row[0] or 0) + 1
+            # Build it first so an invalid calibration is never stored
+            calibration = Calibration(node_id, version, kind, params, temp_coeff, ref_temp, time.time())
+            self.store.conn.execute(
+                "INSERT INTO calibrations (node_id, version, created, kind, params, temp_coeff, ref_temp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (node_id, version, calibration.created, kind, json.dumps(params), temp_coeff, ref_temp),
+            )
+        return calibration
+
+    # Latest calibration of a node (or a specific version), None if it was never calibrated
+    def current(self, node_id, version=None):
+        query = "SELECT * FROM calibrations WHERE node_id = ?"
+        params = [node_id]
+        if version is not None:
+            query += " AND version = ?"
+            params.append(version)
+        with self.store.lock:
+            row = self.store.conn.execute(query + " ORDER BY version DESC LIMIT 1", params).fetchone()
+        return None if row is None else self._from_row(row)
+
+    # Every calibration recorded for a node, oldest first
+    def history(self, node_id):
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                "SELECT * FROM calibrations WHERE node_id = ? ORDER BY version", (node_id,)
+            ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    # Nodes that have at least one calibration
+    def nodes(self):
+        with self.store.lock:
+            rows = self.store.conn.execute("SELECT DISTINCT node_id FROM calibrations ORDER BY node_id").fetchall()
+        return [row[0] for row in rows]
+
+
+# Convert a live reading from a node: calibrated when the node has a calibration, otherwise trusted as-is
+def calibrate_reading(registry, node_id, raw, temperature=None):
+    calibration = registry.current(node_id)
+    if calibration is None:
+        return float(raw)
+    return calibration.apply_one(raw, temperature)
+
+
+# Re-calibrate an uploaded dataset that carries a Raw_Soil_Moisture column
+def calibrate_dataframe(sensor_data, calibration):
+    sensor_data = sensor_data.copy()
+    temperature = sensor_data['Temperature'] if 'Temperature' in sensor_data.columns else None
+    sensor_data['Soil_Moisture_Level'] = calibration.apply(sensor_data['Raw_Soil_Moisture'], temperature)
+    return sensor_data
+
+
+# Re-apply a calibration to all of a node's stored history.
+# Raw readings are converted exactly. Rolled-up tiers only keep raw min/max/mean, so their moisture
+# is recomputed from those (exact for linear curves, a close approximation for curved ones).
+# Each chunk is its own transaction, so the acquisition loop and readers only ever wait for one chunk;
+# an interrupted run leaves some rows converted and is finished by running it again.
+def recalibrate_history(store, calibration):
+    node_id = calibration.node_id
+    updated = 0
+    last_rowid = -1
+    while True:
+        with store.lock, store.conn:
+            chunk = pd.read_sql_query(
+                "SELECT rowid, raw_moisture, temperature FROM readings_raw "
+                "WHERE node_id = ? AND raw_moisture IS NOT NULL AND rowid > ? ORDER BY rowid LIMIT ?",
+                store.conn, params=(node_id, last_rowid, RECALIBRATION_CHUNK),
+            )
+            if chunk.empty:
+                break
+            moisture = calibration.apply(chunk['raw_moisture'], chunk['temperature'])
+            store.conn.executemany(
+                "UPDATE readings_raw SET soil_moisture = ? WHERE rowid = ?",
+                zip(moisture.tolist(), chunk['rowid'].tolist()),
+            )
+            store.mark_edited()
+        updated += len(chunk)
+        last_rowid = int(chunk['rowid'].iloc[-1])
+
+    for tier, _, _ in TIERS[1:]:
+        last_rowid = -1
+        while True:
+            with store.lock, store.conn:
+                rollups = pd.read_sql_query(
+                    f"SELECT rowid, raw_moisture_min, raw_moisture_max, raw_moisture_sum, raw_moisture_count, "
+                    f"temperature_sum, temperature_count FROM readings_{tier} "
+                    f"WHERE node_id = ? AND raw_moisture_count > 0 AND rowid > ? ORDER BY rowid LIMIT ?",
+                    store.conn, params=(node_id, last_rowid, RECALIBRATION_CHUNK),
+                )
+                if rollups.empty:
+                    break
+                counts = rollups['raw_moisture_count']
+                temperature_counts = rollups['temperature_count']
+                temperature = rollups['temperature_sum'] / temperature_counts.where(temperature_counts > 0)
+                from_min = calibration.apply(rollups['raw_moisture_min'], temperature)
+                from_max = calibration.apply(rollups['raw_moisture_max'], temperature)
+                mean = calibration.apply(rollups['raw_moisture_sum'] / counts, temperature)
+                # Probe curves can run either way (dry readings are often the higher raw value)
+                low, high = np.minimum(from_min, from_max), np.maximum(from_min, from_max)
+                store.conn.executemany(
+                    f"UPDATE readings_{tier} SET moisture_min = ?, moisture_max = ?, moisture_sum = ?, "
+                    f"moisture_count = ? WHERE rowid = ?",
+                    zip(low.tolist(), high.tolist(), (mean * counts).tolist(), counts.tolist(),
+                        rollups['rowid'].tolist()),
+                )
+                store.mark_edited()
+            updated += len(rollups)
+            last_rowid = int(rollups['rowid'].iloc[-1])
+    return updated
+
+
+# Record or re-apply calibrations from the command line, e.g.
+#   python calibration.py set http://192.168.101.147 --point 3200 0 --point 1400 100 --recalibrate
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SMART IRRI probe calibration")
+    parser.add_argument("--db", default=HISTORY_DB, help="Path to the sensor history database")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    set_parser = commands.add_parser("set", help="Record a new calibration for a node")
+    set_parser.add_argument("node_id")
+    set_parser.add_argument("--point", nargs=2, type=float, action="append", metavar=("RAW", "PERCENT"),
+                            help="Piecewise calibration point (repeat for each point)")
+    set_parser.add_argument("--poly", nargs="+", type=float, metavar="COEFF",
+                            help="Polynomial coefficients, highest power first")
+    set_parser.add_argument("--temp-coeff", type=float, default=0.0, help="Raw units per degree Celsius")
+    set_parser.add_argument("--ref-temp", type=float, default=25.0, help="Reference temperature in Celsius")
+    set_parser.add_argument("--recalibrate", action="store_true", help="Re-apply to the node's stored history")
+
+    recalibrate_parser = commands.add_parser("recalibrate", help="Re-apply a node's calibration to its history")
+    recalibrate_parser.add_argument("node_id")
+    recalibrate_parser.add_argument("--version", type=int, help="Calibration version (default: latest)")
+
+    show_parser = commands.add_parser("show", help="List a node's calibrations")
+    show_parser.add_argument("node_id")
+
+    args = parser.parse_args()
+    store = HistoryStore(args.db)
+    registry = CalibrationRegistry(store)
+
+    if args.command == "set":
+        if bool(args.point) == bool(args.poly):
+            parser.error("Give either --point (at least twice) or --poly")
+        if args.point:
+            calibration = registry.record(args.node_id, "piecewise", {"points": args.point}, args.temp_coeff, args.ref_temp)
+        else:
+            calibration = registry.record(args.node_id, "polynomial", {"coefficients": args.poly}, args.temp_coeff, args.ref_temp)
+        print(f"Recorded calibration version {calibration.version} for {args.node_id}")
+    elif args.command == "recalibrate":
+        calibration = registry.current(args.node_id, args.version)
+        if calibration is None:
+            parser.error(f"No calibration recorded for {args.node_id}")
+    else:
+        for calibration in registry.history(args.node_id):
+            print(calibration.version, time.ctime(calibration.created), calibration.kind,
+                  json.dumps(calibration.params), calibration.temp_coeff, calibration.ref_temp)
+
+    if args.command == "recalibrate" or (args.command == "set" and args.recalibrate):
+        started = time.perf_counter()
+        updated = recalibrate_history(store, calibration)
+        print(f"Re-calibrated {updated} rows in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,240 @@
+import argparse
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from irrigation_analysis import summarize
+from sensor_history import HISTORY_DB, TIERS, HistoryStore, to_epoch
+
+
+# History tiers a client may ask for
+TIER_NAMES = {name for name, _, _ in TIERS}
+
+# Default page size and upper limit for range queries
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+
+# Raised for bad query parameters; turned into a 400 response
+class BadRequest(Exception):
+    pass
+
+
+# Helper function to read a start/end query parameter given as epoch seconds or an ISO date/time
+def parse_time(value, default):
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return to_epoch(value)
+    except ValueError:
+        raise BadRequest(f"Invalid time: {value}")
+
+
+def parse_int(value, default, minimum=1, maximum=None):
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise BadRequest(f"Invalid number: {value}")
+    number = max(number, minimum)
+    return number if maximum is None else min(number, maximum)
+
+
+# Cursors are opaque to clients: base64 of the tier, the last timestamp already returned and the
+# query window, so later pages read the same window even when it defaulted to "the last 24 hours"
+def encode_cursor(tier, last_ts, start, end):
+    return base64.urlsafe_b64encode(json.dumps([tier, last_ts, start, end]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        tier, last_ts, start, end = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        last_ts, start, end = float(last_ts), float(start), float(end)
+    except (ValueError, TypeError):
+        raise BadRequest("Invalid cursor")
+    if not isinstance(tier, str) or tier not in TIER_NAMES:
+        raise BadRequest("Invalid cursor")
+    return tier, last_ts, start, end
+
+
+# Helper function to read the node and time window of a range query (from the cursor when paging)
+def parse_window(query):
+    node_id = query.get('node')
+    if not node_id:
+        raise BadRequest("Missing 'node' parameter")
+    if 'cursor' in query:
+        tier, after, start, end = decode_cursor(query['cursor'])
+        return node_id, start, end, tier, after
+    now = time.time()
+    start = parse_time(query.get('start'), now - 86400)
+    end = parse_time(query.get('end'), now)
+    return node_id, start, end, query.get('tier'), None
+
+
+# Helper function to turn a readings DataFrame into JSON-ready records
+def to_records(data):
+    data = data.copy()
+    data['Datetime'] = data['Datetime'].dt.strftime('%Y-%m-%dT%H:%M:%S')
+    data = data.astype(object).where(data.notna(), None)
+    return data.to_dict('records')
+
+
+# Small LRU cache of rendered responses, invalidated whenever the history database changes
+class ResponseCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key, version, etag, body):
+        with self.lock:
+            self.entries[key] = (version, etag, body)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# JSON API over the sensor history store
+class DataAPI:
+    def __init__(self, store, cache=None):
+        self.store = store
+        self.cache = cache or ResponseCache()
+        # path -> (handler, version): a response is reused while its version is unchanged
+        self.routes = {
+            '/latest': (self.latest, lambda query: self.store.latest_version()),
+            '/readings': (self.readings, self.range_version),
+            '/recommendation': (self.recommendation, self.range_version),
+            '/pump': (self.pump, lambda query: self.store.pump_version()),
+        }
+
+    # Range responses only change with the node's history up to the end of the window
+    def range_version(self, query):
+        node_id, _, end, _, _ = parse_window(query)
+        return self.store.range_version(node_id, end)
+
+    def latest(self, query):
+        return {'nodes': self.store.latest()}
+
+    def pump(self, query):
+        nodes = self.store.pump_status()
+        if 'node' in query:
+            nodes = [node for node in nodes if node['node_id'] == query['node']]
+        return {'nodes': nodes}
+
+    # Range query with downsampling (through the history tiers) and cursor pagination
+    def readings(self, query):
+        node_id, start, end, tier, after = parse_window(query)
+        max_points = parse_int(query.get('max_points'), 2000)
+        limit = parse_int(query.get('limit'), DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE)
+        if tier is not None and tier not in TIER_NAMES:
+            raise BadRequest(f"Invalid tier: {tier} (expected one of {', '.join(sorted(TIER_NAMES))})")
+
+        data = self.store.load(node_id, start, end, tier=tier, max_points=max_points, limit=limit, after=after)
+        tier = data.attrs['tier']
+        next_cursor = None
+        if len(data) == limit:
+            next_cursor = encode_cursor(tier, data.attrs['last_ts'], start, end)
+        return {'node_id': node_id, 'tier': tier, 'readings': to_records(data), 'next_cursor': next_cursor}
+
+    # Same recommendation the Sensor Data Analysis page shows, for a node and time range
+    def recommendation(self, query):
+        node_id, start, end, _, _ = parse_window(query)
+        data = self.store.load(node_id, start, end)
+        if data.empty:
+            return {'node_id': node_id, 'readings': 0, 'suggestions': []}
+        summary = summarize(data)
+        return {
+            'node_id': node_id,
+            'readings': int(data['Count'].sum()) if 'Count' in data.columns else len(data),
+            'avg_soil_moisture': summary['avg_soil_moisture'],
+            'avg_temperature': summary['avg_temp'],
+            'avg_humidity': summary['avg_humidity'],
+            'suggestions': summary['suggestions'],
+        }
+
+    # Render a request to (status, etag, body), serving unchanged data from the cache
+    def handle(self, path, query):
+        route = self.routes.get(path)
+        if route is None:
+            return 404, None, json.dumps({'error': 'Not found'}).encode()
+        handler, version_of = route
+
+        key = (path, tuple(sorted(query.items())))
+        try:
+            version = version_of(query)
+            cached = self.cache.get(key, version)
+            if cached is not None:
+                return 200, cached[0], cached[1]
+            payload = handler(query)
+        except BadRequest as error:
+            return 400, None, json.dumps({'error': str(error)}).encode()
+
+        body = json.dumps(payload, default=str).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.cache.put(key, version, etag, body)
+        return 200, etag, body
+
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            status, etag, body = api.handle(url.path.rstrip('/') or '/', query)
+
+            # Conditional request: the client already has this version
+            if etag is not None and etag in self.headers.get('If-None-Match', ''):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if etag is not None:
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep the console quiet under load
+
+    return Handler
+
+
+def make_server(host='127.0.0.1', port=8600, db_path=HISTORY_DB):
+    api = DataAPI(HistoryStore(db_path))
+    return ThreadingHTTPServer((host, port), make_handler(api))
+
+
+# Run the data API: python data_api.py --port 8600
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SMART IRRI data API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--db", default=HISTORY_DB, help="Path to the sensor history database")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.db)
+    print(f"Serving SMART IRRI data API on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,189 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from sensor_history import epoch_to_datetime
+
+
+# Latency histogram bucket upper bounds in seconds: 1 ms to 10 s, log-spaced, plus an overflow bucket
+LATENCY_BUCKETS = np.geomspace(0.001, 10, 40)
+
+# Requests per node kept for the recent failure rate, and raw samples kept for drill-down
+OUTCOME_WINDOW = 100
+SAMPLE_WINDOW = 300
+
+# A node is offline after this many seconds without a successful reading
+OFFLINE_AFTER = 60
+
+# Thresholds for flagging a node as flaky or slow
+FLAKY_FAILURE_RATE = 0.1
+SLOW_P99 = 1.0
+
+
+# Per-node health statistics, updated in O(1) per request and kept in fixed-size structures:
+# a latency histogram, a ring of recent request outcomes, a running (Welford) moisture variance
+# and a bounded buffer of recent raw samples.
+class NodeStats:
+    def __init__(self, node_id):
+        self.node_id = node_id
+        self.histogram = np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64)
+        self.requests = 0
+        self.failures = 0
+        self.outcomes = [True] * OUTCOME_WINDOW
+        self.outcome_position = 0
+        self.recent_failures = 0
+        self.last_seen = None
+        self.last_attempt = None
+        self.readings = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def record(self, latency, value, ts):
+        ok = value is not None
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.requests += 1
+        self.last_attempt = ts
+
+        # Slide the outcome window, keeping the failure count in step
+        position = self.outcome_position % OUTCOME_WINDOW
+        self.recent_failures += (not ok) - (not self.outcomes[position])
+        self.outcomes[position] = ok
+        self.outcome_position += 1
+
+        if ok:
+            self.last_seen = ts
+            self.readings += 1
+            delta = value - self.mean
+            self.mean += delta / self.readings
+            self.m2 += delta * (value - self.mean)
+        else:
+            self.failures += 1
+        self.samples.append((ts, value, latency, ok))
+
+    @property
+    def failure_rate(self):
+        window = min(self.outcome_position, OUTCOME_WINDOW)
+        return self.recent_failures / window if window else 0.0
+
+    @property
+    def variance(self):
+        return self.m2 / (self.readings - 1) if self.readings > 1 else np.nan
+
+    # The node's row of the Fleet Health table, before the status is worked out (see fleet_status)
+    def summary(self):
+        histogram = self.histogram[None, :]
+        return {
+            'Node': self.node_id,
+            'Requests': self.requests,
+            'Failure_Rate': self.failure_rate,
+            'Last_Seen': self.last_seen,
+            'Moisture_Mean': self.mean if self.readings else np.nan,
+            'Moisture_Variance': self.variance,
+            'Latency_p50_ms': histogram_percentiles(histogram, 0.5)[0] * 1000,
+            'Latency_p99_ms': histogram_percentiles(histogram, 0.99)[0] * 1000,
+        }
+
+
+# Helper function to read percentiles off a stack of latency histograms (one row per node)
+def histogram_percentiles(histograms, quantile):
+    totals = histograms.sum(axis=1)
+    cumulative = histograms.cumsum(axis=1)
+    targets = np.ceil(totals * quantile).clip(min=1)
+    positions = (cumulative < targets[:, None]).sum(axis=1)
+    upper_bounds = np.append(LATENCY_BUCKETS, np.inf)
+    return np.where(totals > 0, upper_bounds[np.minimum(positions, len(LATENCY_BUCKETS))], np.nan)
+
+
+# Columns of a node's summary row (NodeStats.summary)
+SUMMARY_COLUMNS = ['Node', 'Requests', 'Failure_Rate', 'Last_Seen', 'Moisture_Mean', 'Moisture_Variance',
+                   'Latency_p50_ms', 'Latency_p99_ms']
+
+
+# One row per node with its current health, for sorting and filtering, from the nodes' summary rows
+# (Last_Seen in epoch seconds). The status depends on the time, so it is worked out when shown.
+def fleet_status(fleet, now=None):
+    now = time.time() if now is None else now
+    fleet = fleet.copy()
+    last_seen = fleet['Last_Seen'].astype(float)
+    fleet['Seconds_Since_Seen'] = now - last_seen
+    status = np.select(
+        [last_seen.isna() | (fleet['Seconds_Since_Seen'] > OFFLINE_AFTER),
+         fleet['Failure_Rate'].astype(float) > FLAKY_FAILURE_RATE,
+         fleet['Latency_p99_ms'].astype(float) > SLOW_P99 * 1000],
+        ['Offline', 'Flaky', 'Slow'], default='Healthy',
+    )
+    fleet.insert(1, 'Status', status)
+    fleet['Last_Seen'] = epoch_to_datetime(last_seen)
+    return fleet
+
+
+# Helper function to turn (ts, moisture, latency in seconds, ok) samples into a table, oldest first
+def samples_frame(rows):
+    samples = pd.DataFrame(rows, columns=['ts', 'Soil_Moisture_Level', 'Latency_s', 'OK'])
+    samples.insert(0, 'Datetime', epoch_to_datetime(samples.pop('ts')))
+    samples['Latency_ms'] = samples.pop('Latency_s') * 1000
+    return samples
+
+
+# Helper function to turn latency histogram counts into (upper bound in ms, count) rows
+def histogram_frame(counts=None):
+    if counts is None:
+        counts = np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64)
+    upper_bounds = np.append(LATENCY_BUCKETS, np.inf) * 1000
+    return pd.DataFrame({'Upper_Bound_ms': upper_bounds, 'Requests': counts})
+
+
+# Health statistics for every node this process polls
+class FleetMonitor:
+    def __init__(self):
+        self.nodes = {}
+        self.lock = threading.Lock()
+
+    # Record one request to a node: its latency in seconds and the reading (None if it failed)
+    def record(self, node_id, latency, value=None, ts=None):
+        ts = time.time() if ts is None else ts
+        with self.lock:
+            stats = self.nodes.get(node_id)
+            if stats is None:
+                stats = self.nodes[node_id] = NodeStats(node_id)
+            stats.record(latency, value, ts)
+
+    # Nodes with requests recorded since `published` ({node_id: requests at the last publish}), as
+    # {node_id: {'requests', 'summary', 'histogram', 'samples' (only the ones added since)}}
+    def changes(self, published):
+        changed = {}
+        with self.lock:
+            for node_id, stats in self.nodes.items():
+                new = stats.requests - published.get(node_id, 0)
+                if new <= 0:
+                    continue
+                changed[node_id] = {
+                    'requests': stats.requests, 'summary': stats.summary(), 'histogram': stats.histogram.tolist(),
+                    'samples': list(stats.samples)[-min(new, len(stats.samples)):],
+                }
+        return changed
+
+    # One row per node with its current health, for sorting and filtering
+    def snapshot(self, now=None):
+        with self.lock:
+            rows = [stats.summary() for stats in self.nodes.values()]
+        return fleet_status(pd.DataFrame(rows, columns=SUMMARY_COLUMNS), now)
+
+    # A node's recent raw samples, oldest first
+    def samples(self, node_id):
+        with self.lock:
+            stats = self.nodes.get(node_id)
+            rows = list(stats.samples) if stats else []
+        return samples_frame(rows)
+
+    # A node's latency histogram as (upper bound in ms, count) rows
+    def latency_histogram(self, node_id):
+        with self.lock:
+            stats = self.nodes.get(node_id)
+            counts = stats.histogram.copy() if stats else None
+        return histogram_frame(counts)
@@ -0,0 +1,197 @@
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+
+# Columns the analysis (and playback, for Pump_Status) uses; anything else in an upload is not read
+SENSOR_COLUMNS = ['Datetime', 'Soil_Moisture_Level', 'Temperature', 'Humidity', 'Raw_Soil_Moisture', 'Zone',
+                  'Pump_Status']
+
+# Columns averaged in the summary
+SUMMARY_COLUMNS = ['Soil_Moisture_Level', 'Temperature', 'Humidity']
+
+# Upload formats by file extension: columnar Arrow formats, plain CSV and compressed CSV
+UPLOAD_TYPES = ['csv', 'gz', 'zst', 'parquet', 'feather', 'arrow']
+
+CSV_COMPRESSION = {'.gz': 'gzip', '.zst': 'zstd'}
+
+
+# Helper function to view an upload's bytes as an Arrow buffer without copying them
+def _arrow_buffer(uploaded_file):
+    if hasattr(uploaded_file, 'getbuffer'):
+        return pa.py_buffer(uploaded_file.getbuffer())
+    return pa.py_buffer(uploaded_file.read())
+
+
+# Read an uploaded sensor data file into a DataFrame with a parsed Datetime column.
+# Parquet and Feather/Arrow IPC are read through Arrow with only the sensor columns projected;
+# CSV may be plain, gzip'd (.csv.gz) or zstd-compressed (.csv.zst).
+def load_sensor_file(uploaded_file):
+    name = getattr(uploaded_file, 'name', '').lower()
+
+    if name.endswith('.parquet'):
+        source = pa.BufferReader(_arrow_buffer(uploaded_file))
+        names = pq.read_schema(source).names
+        table = pq.read_table(source, columns=[column for column in SENSOR_COLUMNS if column in names])
+        sensor_data = table.to_pandas()
+    elif name.endswith(('.feather', '.arrow')):
+        buffer = _arrow_buffer(uploaded_file)
+        names = pa.ipc.open_file(buffer).schema.names
+        table = feather.read_table(pa.BufferReader(buffer), columns=[column for column in SENSOR_COLUMNS if column in names])
+        sensor_data = table.to_pandas()
+    else:
+        compression = CSV_COMPRESSION.get(name[name.rfind('.'):]) if '.' in name else None
+        sensor_data = pd.read_csv(uploaded_file, usecols=lambda column: column in SENSOR_COLUMNS,
+                                  compression=compression)
+
+    missing = [column for column in SENSOR_COLUMNS[:2] if column not in sensor_data.columns]
+    if missing:
+        raise ValueError(f"The file is missing the column(s): {', '.join(missing)}")
+
+    sensor_data['Datetime'] = pd.to_datetime(sensor_data['Datetime'])
+    return sensor_data
+
+
+# Serialize the normalized dataset to Parquet for download
+def to_parquet_bytes(sensor_data):
+    buffer = BytesIO()
+    sensor_data.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+# Suggestions based on the average soil moisture level
+def moisture_suggestions(avg_soil_moisture):
+    suggestions = []
+    if avg_soil_moisture < 21:
+        suggestions.append("Very low soil moisture! Immediate irrigation is recommended.")
+    elif avg_soil_moisture < 41:
+        suggestions.append("Low soil moisture. Consider increasing irrigation frequency.")
+    elif avg_soil_moisture < 71:
+        suggestions.append("Optimal soil moisture levels. Continue current irrigation practices.")
+    else:
+        suggestions.append("High soil moisture. Reduce irrigation to avoid overwatering.")
+    return suggestions
+
+
+# Helper function to average a column, weighting rolled-up rows by how many readings they hold
+def _weighted_mean(sensor_data, column):
+    values = sensor_data[column]
+    if 'Count' not in sensor_data.columns:
+        return values.mean()
+    weights = sensor_data['Count'].where(values.notna(), 0)
+    if weights.sum() == 0:
+        return np.nan
+    return float((values.fillna(0) * weights).sum() / weights.sum())
+
+
+# Averages and recommendations for a sensor dataset (uploaded or read from the history store)
+def summarize(sensor_data):
+    avg_soil_moisture = _weighted_mean(sensor_data, 'Soil_Moisture_Level')
+    return {
+        'avg_soil_moisture': avg_soil_moisture,
+        'avg_temp': _weighted_mean(sensor_data, 'Temperature'),
+        'avg_humidity': _weighted_mean(sensor_data, 'Humidity'),
+        'suggestions': moisture_suggestions(avg_soil_moisture),
+    }
+
+
+# Zone shown for rows whose Zone is blank
+UNASSIGNED_ZONE = "Unassigned"
+
+
+# Helper function to build a prefix-sum array with a leading zero, so sum(values[i:j]) = prefix[j] - prefix[i]
+def _prefix_sum(values):
+    prefix = np.zeros(len(values) + 1)
+    np.cumsum(values, out=prefix[1:])
+    return prefix
+
+
+# A sensor dataset indexed for fast range queries. Rows are split by zone (when the data has a
+# Zone column) and sorted by Datetime once; a date range is then found with a binary search on the
+# DatetimeIndex, and averages come from precomputed prefix sums, so changing the range or zones
+# costs O(zones * log n) instead of a pass over every row.
+class IndexedSensorData:
+    def __init__(self, sensor_data):
+        # Rows without a date cannot be placed on the index
+        sensor_data = sensor_data.dropna(subset=['Datetime'])
+        self.has_zones = 'Zone' in sensor_data.columns
+        # Rows without a zone are kept, as their own zone listed last
+        groups = sensor_data.groupby('Zone', sort=True, dropna=False) if self.has_zones else [(None, sensor_data)]
+        self.parts = {}
+        for zone, part in groups:
+            part = part.sort_values('Datetime', kind='stable').reset_index(drop=True)
+            if self.has_zones and pd.isna(zone):
+                zone = UNASSIGNED_ZONE  # Only the filter label; the rows keep their blank Zone
+            index = pd.DatetimeIndex(part['Datetime'])
+            # Rolled-up history rows stand for several readings each
+            weights = part['Count'].to_numpy(dtype=float) if 'Count' in part.columns else np.ones(len(part))
+            sums = {}
+            for column in SUMMARY_COLUMNS:
+                values = part[column].to_numpy(dtype=float) if column in part.columns else np.full(len(part), np.nan)
+                valid_weights = np.where(np.isnan(values), 0.0, weights)
+                sums[column] = (_prefix_sum(np.nan_to_num(values) * valid_weights), _prefix_sum(valid_weights))
+            self.parts[zone] = (part, index, sums)
+
+    # True when no row has a date
+    @property
+    def empty(self):
+        return all(len(index) == 0 for _, index, _ in self.parts.values())
+
+    @property
+    def zones(self):
+        return list(self.parts) if self.has_zones else []
+
+    # Earliest and latest Datetime in the dataset
+    def bounds(self):
+        indexes = [index for _, index, _ in self.parts.values() if len(index)]
+        return min(index[0] for index in indexes), max(index[-1] for index in indexes)
+
+    # Row positions [i, j) of each selected zone that fall within start..end (inclusive)
+    def _ranges(self, start, end, zones):
+        selected = self.parts if zones is None or not self.has_zones else {zone: self.parts[zone] for zone in zones}
+        for zone, (part, index, sums) in selected.items():
+            i = index.searchsorted(pd.Timestamp(start), side='left')
+            j = index.searchsorted(pd.Timestamp(end), side='right')
+            yield part, sums, i, j
+
+    # Number of rows in the range
+    def count(self, start, end, zones=None):
+        return sum(j - i for _, _, i, j in self._ranges(start, end, zones))
+
+    # Averages and recommendations for the range, from the prefix sums
+    def summary(self, start, end, zones=None):
+        totals = {column: [0.0, 0.0] for column in SUMMARY_COLUMNS}
+        for _, sums, i, j in self._ranges(start, end, zones):
+            for column, (value_sums, weight_sums) in sums.items():
+                totals[column][0] += value_sums[j] - value_sums[i]
+                totals[column][1] += weight_sums[j] - weight_sums[i]
+        means = {column: total / weight if weight else np.nan for column, (total, weight) in totals.items()}
+        avg_soil_moisture = means['Soil_Moisture_Level']
+        return {
+            'avg_soil_moisture': avg_soil_moisture,
+            'avg_temp': means['Temperature'],
+            'avg_humidity': means['Humidity'],
+            'suggestions': [] if np.isnan(avg_soil_moisture) else moisture_suggestions(avg_soil_moisture),
+        }
+
+    # The rows in the range: all of them, only the first `limit`, or about max_rows evenly spaced rows (for charts)
+    def slice(self, start, end, zones=None, max_rows=None, limit=None):
+        ranges = list(self._ranges(start, end, zones))
+        if limit is not None:
+            # The first `limit` rows overall are among the first `limit` rows of each zone
+            ranges = [(part, sums, i, min(j, i + limit)) for part, sums, i, j in ranges]
+        total = sum(j - i for _, _, i, j in ranges)
+        step = 1 if not max_rows or total <= max_rows else -(-total // max_rows)
+        pieces = [part.iloc[i:j:step] for part, _, i, j in ranges]
+        if not pieces:
+            return pd.DataFrame(columns=SENSOR_COLUMNS)
+        rows = pd.concat(pieces) if len(pieces) > 1 else pieces[0]
+        if len(pieces) > 1:
+            rows = rows.sort_values('Datetime', kind='stable')
+        if limit is not None:
+            rows = rows.head(limit)
+        return rows.reset_index(drop=True)
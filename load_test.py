@@ -0,0 +1,372 @@
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Smart_Irrigation_System.py")
+
+
+# A fleet of fake ESP32 nodes served from one local HTTP server, one URL per node
+# (http://127.0.0.1:<port>/node/<n>), with injected latency and failures
+class FakeESP32Fleet:
+    def __init__(self, nodes, latency_ms=20, jitter_ms=10, failure_rate=0.0, host="127.0.0.1", port=0):
+        self.nodes = nodes
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.failure_rate = failure_rate
+        self.moisture = [random.uniform(30, 70) for _ in range(nodes)]
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    def _make_handler(self):
+        fleet = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    node = int(self.path.rstrip("/").rsplit("/", 1)[-1])
+                except ValueError:
+                    node = -1
+                if not 0 <= node < fleet.nodes:
+                    self.send_error(404)
+                    return
+
+                time.sleep(max(0.0, fleet.latency + random.uniform(-fleet.jitter, fleet.jitter)))
+                if random.random() < fleet.failure_rate:
+                    if random.random() < 0.5:
+                        self.send_error(500)
+                    else:
+                        self.close_connection = True  # Drop the connection without answering
+                    return
+
+                # Each node's moisture wanders slowly, like a real probe
+                fleet.moisture[node] = min(100.0, max(0.0, fleet.moisture[node] + random.uniform(-1, 1)))
+                body = json.dumps({
+                    "soil_moisture": round(fleet.moisture[node]),
+                    "temperature": round(random.uniform(25, 32), 1),
+                    "humidity": round(random.uniform(60, 85)),
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def node_urls(self):
+        host, port = self.server.server_address[:2]
+        return [f"http://{host}:{port}/node/{node}" for node in range(self.nodes)]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-esp32-fleet", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Clock ticks per second and page size, for reading process usage from /proc
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = resource.getpagesize()
+
+
+# Helper function to read a process's CPU seconds and resident set size in bytes from /proc
+# (None once it has exited, or where there is no /proc)
+def process_usage(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()  # The command name may contain spaces
+        with open(f"/proc/{pid}/statm") as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS, pages * PAGE_SIZE
+
+
+# Samples the combined CPU usage and RSS of the app's worker processes in the background while a
+# load level runs (Linux only; without /proc the columns stay empty)
+class ProcessSampler:
+    def __init__(self, pids, interval=0.5):
+        self.pids = pids
+        self.interval = interval
+        self.cpu_percent = []
+        self.rss = []
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+
+    def _run(self):
+        last_wall, last_cpu = time.perf_counter(), {}
+        while not self.stop_event.wait(self.interval):
+            wall, cpu, rss = time.perf_counter(), 0.0, 0
+            for pid in self.pids:
+                usage = process_usage(pid)
+                if usage is None:
+                    continue
+                cpu += usage[0] - last_cpu.get(pid, 0.0)
+                rss += usage[1]
+                last_cpu[pid] = usage[0]
+            if last_cpu:
+                self.cpu_percent.append(100 * cpu / (wall - last_wall))
+                self.rss.append(rss)
+            last_wall = wall
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        return {
+            "cpu_percent_mean": float(np.mean(self.cpu_percent)) if self.cpu_percent else None,
+            "cpu_percent_max": float(np.max(self.cpu_percent)) if self.cpu_percent else None,
+            "rss_mb_peak": max(self.rss) / 2 ** 20 if self.rss else None,
+        }
+
+
+def percentiles(samples, prefix):
+    if not samples:
+        return {f"{prefix}_p50_ms": None, f"{prefix}_p99_ms": None}
+    p50, p99 = np.percentile(np.asarray(samples) * 1000, [50, 99])
+    return {f"{prefix}_p50_ms": float(p50), f"{prefix}_p99_ms": float(p99)}
+
+
+# Poll every node once per second for the given duration, the way the real-time page reads one node
+def run_polling(node_urls, duration, workers=32):
+    from Smart_Irrigation_System import read_soil_moisture
+
+    latencies, sweeps, failures = [], [], 0
+
+    def poll(url):
+        started = time.perf_counter()
+        value = read_soil_moisture(url)
+        return time.perf_counter() - started, value is None
+
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(max_workers=min(workers, len(node_urls))) as pool:
+        while time.perf_counter() < deadline:
+            sweep_started = time.perf_counter()
+            for latency, failed in pool.map(poll, node_urls):
+                latencies.append(latency)
+                failures += failed
+            sweep = time.perf_counter() - sweep_started
+            sweeps.append(sweep)
+            time.sleep(max(0.0, 1 - sweep))
+
+    result = {"polls": len(latencies), "poll_failure_rate": failures / max(len(latencies), 1)}
+    result.update(percentiles(latencies, "poll"))
+    result.update(percentiles(sweeps, "sweep"))
+    return result
+
+
+# Run one headless Streamlit session that logs in and watches the real-time page for a number of ticks.
+# Ticks render the reading the acquiring replica publishes (the app polls SMART_IRRI_ESP32_IP once per
+# second in the background, however many sessions there are), so tick latency measures serving a session.
+# AppTest drives the process-global Streamlit runtime, so each session needs a process of its own.
+def run_session(ticks, username, password):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=ticks * 2 + 60)
+    app.run()
+    app.sidebar.text_input[0].input(username)
+    app.sidebar.text_input[1].input(password)
+    app.run()
+    if app.exception:
+        return {"error": f"session raised: {app.exception[0].message}"}
+    try:
+        return {"tick_latencies": list(app.session_state["tick_latencies"])}
+    except KeyError:
+        errors = [element.value for element in app.error]
+        return {"error": "session recorded no ticks" + (f": {'; '.join(errors)}" if errors else "")}
+
+
+# Helper function to build a synthetic sensor CSV like the ones farmers upload
+def synthetic_upload(rows):
+    datetimes = pd.date_range("2024-01-01", periods=rows, freq="10s")
+    sensor_data = pd.DataFrame({
+        "Datetime": datetimes.strftime("%m/%d/%Y %H:%M:%S"),
+        "Soil_Moisture_Level": np.random.randint(10, 90, rows),
+        "Temperature": np.round(np.random.uniform(25, 32, rows), 1),
+        "Humidity": np.random.randint(60, 85, rows),
+    })
+    return sensor_data.to_csv(index=False).encode()
+
+
+# Push concurrent uploads through the same loading and summary path as the analysis page
+def run_uploads(uploads, rows):
+    from irrigation_analysis import load_sensor_file, summarize
+
+    payload = synthetic_upload(rows)
+
+    def upload(_):
+        started = time.perf_counter()
+        summarize(load_sensor_file(BytesIO(payload)))
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=max(uploads, 1)) as pool:
+        latencies = list(pool.map(upload, range(uploads)))
+
+    result = {"uploads": len(latencies)}
+    result.update(percentiles(latencies, "upload"))
+    return result
+
+
+# Start a worker process running one workload of this script (see run_worker)
+def start_worker(spec):
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", json.dumps(spec)],
+                            stdout=subprocess.PIPE, text=True)
+
+
+# Helper function to wait for a worker and read its result, the last line it printed
+def worker_result(process):
+    output, _ = process.communicate()
+    try:
+        return json.loads(output.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return {"error": f"worker exited with status {process.returncode} without a result"}
+
+
+# Worker process body: run one workload and print its result as a JSON line. The fleet worker
+# prints its node URLs instead and serves until it is terminated.
+def run_worker(spec):
+    if spec["kind"] == "fleet":
+        fleet = FakeESP32Fleet(spec["nodes"], spec["latency_ms"], spec["jitter_ms"], spec["failure_rate"]).start()
+        print(json.dumps(fleet.node_urls), flush=True)
+        fleet.thread.join()
+        return
+    try:
+        if spec["kind"] == "session":
+            result = run_session(spec["ticks"], spec["username"], spec["password"])
+        elif spec["kind"] == "polling":
+            result = run_polling(spec["node_urls"], spec["duration"])
+        else:
+            result = run_uploads(spec["uploads"], spec["rows"])
+    except Exception as error:
+        result = {"error": f"{spec['kind']} worker failed: {type(error).__name__}: {error}"}
+    print(json.dumps(result), flush=True)
+
+
+# Run all three workloads together at one concurrency level, polling the first level * nodes_per_level
+# nodes of the fleet. Every dashboard session, the polling and the uploads run in processes of their
+# own; each session process is a full app replica, so they elect one acquiring leader between them
+# like a multi-replica deployment does. CPU and RSS are those of these app processes, not the harness.
+def run_level(level, node_urls, args):
+    node_urls = node_urls[:level * args.nodes_per_level]
+
+    started = time.perf_counter()
+    sessions = [
+        start_worker({"kind": "session", "ticks": args.ticks, "username": args.username, "password": args.password})
+        for _ in range(level)
+    ]
+    polling = start_worker({"kind": "polling", "node_urls": node_urls, "duration": args.ticks})
+    uploads = start_worker({"kind": "uploads", "uploads": level * args.uploads_per_level, "rows": args.upload_rows})
+    sampler = ProcessSampler([worker.pid for worker in sessions + [polling, uploads]]).start()
+
+    session_results = [worker_result(worker) for worker in sessions]
+    other_results = [worker_result(polling), worker_result(uploads)]
+    result = {"level": level, "nodes": len(node_urls), "sessions": level}
+    result["wall_s"] = time.perf_counter() - started
+    result.update(sampler.stop())
+
+    # Failed sessions are reported, not just left out of the latencies
+    errors = [worker["error"] for worker in session_results + other_results if "error" in worker]
+    tick_latencies = [latency for worker in session_results for latency in worker.get("tick_latencies", [])]
+    result["sessions_completed"] = sum(1 for worker in session_results if worker.get("tick_latencies"))
+    result["errors"] = errors
+    result["ticks"] = len(tick_latencies)
+    result.update(percentiles(tick_latencies, "tick"))
+    for worker in other_results:
+        result.update({name: value for name, value in worker.items() if name != "error"})
+    return result
+
+
+def print_table(results):
+    columns = [
+        ("level", "{}"), ("nodes", "{}"), ("sessions_completed", "{}"), ("tick_p50_ms", "{:.1f}"), ("tick_p99_ms", "{:.1f}"),
+        ("poll_p50_ms", "{:.1f}"), ("poll_p99_ms", "{:.1f}"), ("sweep_p99_ms", "{:.1f}"),
+        ("poll_failure_rate", "{:.2%}"), ("upload_p50_ms", "{:.0f}"), ("upload_p99_ms", "{:.0f}"),
+        ("cpu_percent_mean", "{:.0f}"), ("rss_mb_peak", "{:.0f}"),
+    ]
+    print("  ".join(f"{name:>17}" for name, _ in columns))
+    for result in results:
+        cells = ["-" if result.get(name) is None else fmt.format(result[name]) for name, fmt in columns]
+        print("  ".join(f"{cell:>17}" for cell in cells))
+    for result in results:
+        for error in result["errors"]:
+            print(f"level {result['level']}: {error}")
+
+
+# Capacity planning for a site in one command, e.g.
+#   python load_test.py --levels 1,5,10,25 --nodes-per-level 20 --failure-rate 0.02
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SMART IRRI load test")
+    parser.add_argument("--levels", default="1,5,10", help="Comma-separated dashboard session counts to test")
+    parser.add_argument("--nodes-per-level", type=int, default=10, help="Fake ESP32 nodes polled per session")
+    parser.add_argument("--uploads-per-level", type=int, default=1, help="Concurrent analysis uploads per session")
+    parser.add_argument("--upload-rows", type=int, default=100_000, help="Rows in each synthetic upload")
+    parser.add_argument("--ticks", type=int, default=5, help="Real-time ticks per dashboard session")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Fake node response latency")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="Random +/- latency jitter")
+    parser.add_argument("--failure-rate", type=float, default=0.01, help="Share of node requests that fail")
+    parser.add_argument("--username", default="john_doe", help="Existing user the sessions log in as")
+    parser.add_argument("--password", default="12345")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)  # Internal: run one workload (JSON spec)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(json.loads(args.worker))
+        sys.exit()
+
+    # Keep load-test readings out of the real sensor history; the app resolves relative files from here.
+    # Workers inherit the environment and working directory.
+    os.environ.setdefault("SMART_IRRI_HISTORY_DB", os.path.join(tempfile.mkdtemp(), "load_test_history.db"))
+    os.chdir(os.path.dirname(APP_PATH))
+
+    # Create the history schema once, before replicas start at the same time
+    from sensor_history import HistoryStore
+    from shared_state import SharedState
+    SharedState(HistoryStore(os.environ["SMART_IRRI_HISTORY_DB"]))
+
+    # One fleet, and one ESP32 address for the app, for the whole run
+    levels = [int(level) for level in args.levels.split(",")]
+    fleet = start_worker({"kind": "fleet", "nodes": max(levels) * args.nodes_per_level, "latency_ms": args.latency_ms,
+                          "jitter_ms": args.jitter_ms, "failure_rate": args.failure_rate})
+    try:
+        node_urls = json.loads(fleet.stdout.readline())
+        os.environ["SMART_IRRI_ESP32_IP"] = node_urls[0]
+        os.environ["SMART_IRRI_MAX_TICKS"] = str(args.ticks)
+
+        results = []
+        for level in levels:
+            print(f"Running level {level}...", flush=True)
+            results.append(run_level(level, node_urls, args))
+    finally:
+        fleet.terminate()
+        fleet.wait()
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(results, output, indent=2)
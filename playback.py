@@ -0,0 +1,292 @@
+import queue
+import threading
+import time
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from pump_accounting import PUMP_ON_BELOW
+from sensor_history import LOCAL_TZ, TIERS
+
+
+# Playback speeds offered on the real-time page (1x is real time)
+SPEEDS = [1, 2, 5, 10, 30, 60, 100, 300, 1000]
+
+# Readings per prefetched chunk, and how many chunks may wait in the buffer
+CHUNK_ROWS = 2000
+PREFETCH_CHUNKS = 4
+
+# How often an idle reader thread checks whether its player still exists
+READER_IDLE_CHECK = 1.0
+
+
+# Helper function to make an empty chunk
+def _empty_chunk():
+    return {'ts': np.array([], dtype=float), 'soil_moisture': np.array([], dtype=float),
+            'pump_status': np.array([], dtype=object)}
+
+
+# A node's stored timeline, read straight from the history database. Each tier is read only where no
+# finer tier still has data, so the timeline runs from daily averages for old history down to raw
+# readings for the last days. Every read is a range scan on a (node_id, ts) index, so a seek costs
+# the same anywhere in the history.
+class HistoryTimeline:
+    def __init__(self, store, node_id):
+        self.store = store
+        self.node_id = node_id
+        self.spans = []  # (tier, time column, first time in the tier, first time in a finer tier), finest first
+        finer_start = np.inf
+        with store.lock:
+            for tier, width, _ in TIERS:
+                column = "ts" if width is None else "bucket"
+                first = store.conn.execute(
+                    f"SELECT MIN({column}) FROM readings_{tier} WHERE node_id = ?", (node_id,)
+                ).fetchone()[0]
+                if first is not None and first < finer_start:
+                    self.spans.append((tier, column, first, finer_start))
+                    finer_start = first
+
+    # First and last reading time, in epoch seconds (None, None without data)
+    def bounds(self):
+        if not self.spans:
+            return None, None
+        tier, column, _, _ = self.spans[0]
+        with self.store.lock:
+            last = self.store.conn.execute(
+                f"SELECT MAX({column}) FROM readings_{tier} WHERE node_id = ?", (self.node_id,)
+            ).fetchone()[0]
+        return self.spans[-1][2], last
+
+    # Time of the last reading at or before ts, so a seek starts on the reading shown at that time
+    def previous(self, ts):
+        with self.store.lock:
+            for tier, column, first, finer_start in self.spans:
+                if first <= ts:
+                    found = self.store.conn.execute(
+                        f"SELECT MAX({column}) FROM readings_{tier} WHERE node_id = ? AND {column} <= ?",
+                        (self.node_id, min(ts, np.nextafter(finer_start, -np.inf))),
+                    ).fetchone()[0]
+                    if found is not None:
+                        return found
+        return None
+
+    # Up to `rows` readings from ts onwards, oldest first
+    def read(self, ts, rows):
+        pieces = []
+        with self.store.lock:
+            for tier, column, first, finer_start in reversed(self.spans):
+                if finer_start <= ts or rows <= 0:
+                    continue
+                value = "soil_moisture" if tier == "raw" else "moisture_sum / NULLIF(moisture_count, 0)"
+                piece = self.store.conn.execute(
+                    f"SELECT {column}, {value} FROM readings_{tier} "
+                    f"WHERE node_id = ? AND {column} >= ? AND {column} < ? ORDER BY {column} LIMIT ?",
+                    (self.node_id, ts, finer_start, rows),
+                ).fetchall()
+                pieces.extend(piece)
+                rows -= len(piece)
+            if not pieces:
+                return _empty_chunk()
+
+            # Pump status at each reading: the last pump event at or before it
+            times = np.array([row[0] for row in pieces], dtype=float)
+            events = self.store.conn.execute(
+                "SELECT ts, status FROM (SELECT ts, status FROM pump_events WHERE node_id = ? AND ts <= ? "
+                "ORDER BY ts DESC LIMIT 1) UNION ALL "
+                "SELECT ts, status FROM pump_events WHERE node_id = ? AND ts > ? AND ts <= ? ORDER BY ts",
+                (self.node_id, times[0], self.node_id, times[0], times[-1]),
+            ).fetchall()
+        event_times = np.array([event[0] for event in events], dtype=float)
+        statuses = np.array(["OFF"] + [event[1] for event in events], dtype=object)
+        return {
+            'ts': times,
+            'soil_moisture': np.array([row[1] for row in pieces], dtype=float),
+            'pump_status': statuses[np.searchsorted(event_times, times, side='right')],
+        }
+
+
+# An uploaded timeline (already loaded by the analysis loader), sorted once and read by binary search.
+# Readings without a Pump_Status (no column, or a blank cell) get the status the auto mode would have set.
+class FrameTimeline:
+    def __init__(self, sensor_data):
+        sensor_data = sensor_data.dropna(subset=['Datetime', 'Soil_Moisture_Level'])
+        sensor_data = sensor_data.sort_values('Datetime', kind='stable')
+        datetimes = pd.DatetimeIndex(sensor_data['Datetime'])
+        if datetimes.tz is None:
+            datetimes = datetimes.tz_localize(LOCAL_TZ, ambiguous='NaT', nonexistent='shift_forward')
+        self.ts = (datetimes - pd.Timestamp(0, tz='UTC')).total_seconds().to_numpy()
+        self.soil_moisture = sensor_data['Soil_Moisture_Level'].to_numpy(dtype=float)
+        self.pump_status = np.where(self.soil_moisture < PUMP_ON_BELOW, "ON", "OFF").astype(object)
+        if 'Pump_Status' in sensor_data.columns:
+            recorded = sensor_data['Pump_Status'].astype("string").str.strip().str.upper()
+            known = recorded.notna() & (recorded != "")
+            self.pump_status[known.to_numpy()] = recorded[known].to_numpy(dtype=object)
+
+    def bounds(self):
+        if not len(self.ts):
+            return None, None
+        return self.ts[0], self.ts[-1]
+
+    def previous(self, ts):
+        i = np.searchsorted(self.ts, ts, side='right')
+        return self.ts[i - 1] if i else None
+
+    def read(self, ts, rows):
+        i = np.searchsorted(self.ts, ts, side='left')
+        return {'ts': self.ts[i:i + rows], 'soil_moisture': self.soil_moisture[i:i + rows],
+                'pump_status': self.pump_status[i:i + rows]}
+
+
+# Reader thread body. It holds the player only through a weak reference, and only for one step at a
+# time, so a player dropped with its session is garbage-collected and the thread exits on its own.
+def _prefetch(player_ref, wake, stopped):
+    while not stopped.is_set():
+        if not wake.wait(timeout=READER_IDLE_CHECK):
+            if player_ref() is None:
+                return
+            continue
+        player = player_ref()
+        if player is None:
+            return
+        wake.clear()
+        busy = player._read_step()
+        del player
+        if busy:
+            wake.set()
+
+
+# Replays a timeline at an adjustable speed. A background thread reads the timeline ahead of the
+# playback position in chunks into a bounded buffer, so memory stays flat however long the history
+# is; seeking bumps a generation counter, which discards buffered chunks and restarts the reader.
+class Playback:
+    def __init__(self, timeline, speed=1, chunk_rows=CHUNK_ROWS, prefetch=PREFETCH_CHUNKS):
+        self.timeline = timeline
+        self.chunk_rows = chunk_rows
+        self.buffer = queue.Queue(maxsize=prefetch)
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.speed = speed
+        self.playing = False
+        self.first, self.last = timeline.bounds()
+        self.generation = 0
+        self.cursor = self.first
+        self.base_position = self.first
+        self.base_time = time.monotonic()
+        self.chunk = _empty_chunk()
+        self.finished = False
+        self.shown = None
+
+        # Reader state: the generation and cursor it is reading, and a chunk waiting for buffer space
+        self.read_generation = None
+        self.read_cursor = None
+        self.pending = None
+        threading.Thread(target=_prefetch, args=(weakref.ref(self), self.wake, self.stopped),
+                         name="playback-prefetch", daemon=True).start()
+        self.wake.set()
+
+    # One reader step: read the next chunk, or hand the waiting one to the buffer.
+    # Returns True while there is more to do before the next seek.
+    def _read_step(self):
+        with self.lock:
+            if self.read_generation != self.generation:
+                # Seeked: start over from the new cursor
+                self.read_generation, self.read_cursor, self.pending = self.generation, self.cursor, None
+            generation = self.read_generation
+        if self.pending is None:
+            if self.read_cursor is None:
+                return False
+            chunk = self.timeline.read(self.read_cursor, self.chunk_rows)
+            done = len(chunk['ts']) < self.chunk_rows
+            self.read_cursor = None if done else np.nextafter(chunk['ts'][-1], np.inf)
+            self.pending = (generation, chunk, done)
+        try:
+            self.buffer.put(self.pending, timeout=0.1)
+        except queue.Full:
+            return True
+        self.pending = None
+        return self.read_cursor is not None
+
+    # Current playback time in epoch seconds
+    def position(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if self.base_position is None:
+                return None
+            if not self.playing:
+                return self.base_position
+            return min(self.base_position + (now - self.base_time) * self.speed, self.last)
+
+    # Restart the clock from the current position, e.g. before changing speed or pausing
+    def _rebase(self, playing, speed):
+        position = self.position()
+        with self.lock:
+            self.base_position, self.base_time = position, time.monotonic()
+            self.playing, self.speed = playing, speed
+
+    def play(self):
+        self._rebase(True, self.speed)
+
+    def pause(self):
+        self._rebase(False, self.speed)
+
+    def set_speed(self, speed):
+        self._rebase(self.playing, speed)
+
+    # Jump to ts (epoch seconds): reading restarts at the reading shown at that time
+    def seek(self, ts):
+        if self.first is None:
+            return
+        ts = min(max(ts, self.first), self.last)
+        start = self.timeline.previous(ts)
+        with self.lock:
+            self.generation += 1
+            self.cursor = self.first if start is None else start
+            self.base_position, self.base_time = ts, time.monotonic()
+            self.chunk = _empty_chunk()
+            self.finished = False
+            self.shown = None
+            while True:
+                try:
+                    self.buffer.get_nowait()
+                except queue.Empty:
+                    break
+        self.wake.set()
+
+    # The reading and pump status at the current playback position, as a dict with ts, soil_moisture,
+    # pump_status and position (or None before the first reading arrives); `buffering` is True while
+    # the reader is behind the playback position.
+    def frame(self, now=None):
+        position = self.position(now)
+        if position is None:
+            return None
+        buffering = False
+        while not len(self.chunk['ts']) or (self.chunk['ts'][-1] < position and not self.finished):
+            try:
+                generation, chunk, done = self.buffer.get_nowait()
+            except queue.Empty:
+                buffering = not self.finished
+                break
+            if generation != self.generation:
+                continue  # Read before the last seek
+            if len(chunk['ts']):
+                self.chunk = chunk
+            self.finished = done
+            if done:
+                break
+
+        i = np.searchsorted(self.chunk['ts'], position, side='right') - 1
+        if i >= 0:
+            self.shown = {'ts': self.chunk['ts'][i], 'soil_moisture': self.chunk['soil_moisture'][i],
+                          'pump_status': self.chunk['pump_status'][i]}
+        if self.shown is None:
+            return None
+        if self.finished and position >= self.last:
+            self.pause()
+        return dict(self.shown, position=position, buffering=buffering)
+
+    # Stop the reader thread (when the user leaves playback or picks another timeline)
+    def close(self):
+        self.stopped.set()
+        self.wake.set()
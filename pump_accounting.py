@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from sensor_history import HISTORY_DB, LOCAL_TZ, HistoryStore, epoch_to_datetime, to_epoch
+
+
+# Node -> zone/client/flow rate settings (SMART_IRRI_PUMP_CONFIG overrides the path); "client" is the
+# client's login username, e.g.
+# {"default_flow_rate_lpm": 10,
+#  "nodes": {"http://192.168.101.147": {"zone": "Zone A", "client": "john_doe", "flow_rate_lpm": 12.5}}}
+PUMP_CONFIG_FILE = os.environ.get("SMART_IRRI_PUMP_CONFIG", "pump_config.json")
+
+# Auto mode switches the pump ON below this soil moisture (%) and OFF at or above it
+PUMP_ON_BELOW = 50
+
+# Litres per minute assumed for pumps without a configured flow rate
+DEFAULT_FLOW_RATE = 10.0
+
+# Windows used to measure the moisture response to a pump run, in seconds
+RESPONSE_BEFORE = 600
+RESPONSE_AFTER = 1800
+
+
+# Helper function to load the pump configuration, or an empty one if there is no file
+def load_pump_config(path=PUMP_CONFIG_FILE):
+    if os.path.exists(path):
+        with open(path) as config_file:
+            return json.load(config_file)
+    return {"default_flow_rate_lpm": DEFAULT_FLOW_RATE, "nodes": {}}
+
+
+# Zone, client and flow rate for each node (unconfigured nodes are their own zone, with no client)
+def node_settings(config, node_ids):
+    default_flow_rate = config.get("default_flow_rate_lpm", DEFAULT_FLOW_RATE)
+    configured = config.get("nodes", {})
+    return pd.DataFrame({
+        "node_id": node_ids,
+        "Zone": [configured.get(node, {}).get("zone", node) for node in node_ids],
+        "Client": [configured.get(node, {}).get("client", "Unassigned") for node in node_ids],
+        "Flow_Rate_Lpm": [configured.get(node, {}).get("flow_rate_lpm", default_flow_rate) for node in node_ids],
+    })
+
+
+# Pump runs as (node_id, Start, End) intervals in epoch seconds, clipped to [start, end), with
+# Started holding each run's unclipped start. A pump that is still ON counts as running until now.
+def pump_intervals(store, start=None, end=None, now=None):
+    now = time.time() if now is None else to_epoch(now)
+    start = -np.inf if start is None else to_epoch(start)
+    end = now if end is None else min(to_epoch(end), now)
+
+    with store.lock:
+        events = pd.read_sql_query(
+            "SELECT node_id, ts, status FROM pump_events WHERE ts < ? ORDER BY node_id, ts",
+            store.conn, params=(end,),
+        )
+    if events.empty:
+        return pd.DataFrame({"node_id": pd.Series(dtype=object), "Start": pd.Series(dtype=float),
+                             "End": pd.Series(dtype=float), "Started": pd.Series(dtype=float)})
+
+    # Only status changes matter; repeated ON/OFF events are folded into the run they belong to
+    node_changed = events["node_id"] != events["node_id"].shift()
+    events = events[node_changed | (events["status"] != events["status"].shift())]
+    next_ts = events.groupby("node_id")["ts"].shift(-1).fillna(end)
+
+    runs = events["status"] == "ON"
+    intervals = pd.DataFrame({
+        "node_id": events.loc[runs, "node_id"].to_numpy(),
+        "Start": np.maximum(events.loc[runs, "ts"].to_numpy(), start),
+        "End": np.minimum(next_ts[runs].to_numpy(), end),
+        "Started": events.loc[runs, "ts"].to_numpy(),
+    })
+    return intervals[intervals["End"] > intervals["Start"]].reset_index(drop=True)
+
+
+# Total pump-on time before each time in `times`, for one node's (non-overlapping) intervals:
+# on_time(t) = sum over runs of clip(t - start, 0, end - start), evaluated for all t at once
+# with binary searches into the sorted starts/ends and their prefix sums.
+def on_time_before(starts, ends, times):
+    starts, ends = np.sort(starts), np.sort(ends)
+    start_sums = np.concatenate([[0.0], np.cumsum(starts)])
+    end_sums = np.concatenate([[0.0], np.cumsum(ends)])
+    started = np.searchsorted(starts, times, side="right")
+    ended = np.searchsorted(ends, times, side="right")
+    return (started * times - start_sums[started]) - (ended * times - end_sums[ended])
+
+
+# Helper function to turn epoch seconds into a local, timezone-naive Timestamp
+def local_timestamp(epoch):
+    return pd.Timestamp(epoch, unit="s", tz="UTC").tz_convert(LOCAL_TZ).tz_localize(None)
+
+
+# Helper function to make local calendar boundaries (days, months) covering start..end, as epochs
+def period_boundaries(start, end, freq):
+    first = local_timestamp(start).normalize()
+    if freq == "MS":
+        first = first.replace(day=1)
+    periods = pd.date_range(first, local_timestamp(end), freq=freq)
+    periods = periods.append(pd.DatetimeIndex([periods[-1] + pd.tseries.frequencies.to_offset(freq)]))
+    return periods, (periods.tz_localize(LOCAL_TZ) - pd.Timestamp(0, tz="UTC")).total_seconds().to_numpy()
+
+
+# Runtime and estimated litres per node and calendar period ("D" for days, "MS" for months)
+def pump_usage(store, config, start, end, freq="D", now=None):
+    start, end = to_epoch(start), to_epoch(end)
+    intervals = pump_intervals(store, start, end, now=now)
+    if intervals.empty:
+        return pd.DataFrame(columns=["node_id", "Zone", "Client", "Period", "Runtime_Hours", "Litres", "Runs"])
+
+    periods, boundaries = period_boundaries(start, end, freq)
+    rows = []
+    for node_id, runs in intervals.groupby("node_id"):
+        on_time = on_time_before(runs["Start"].to_numpy(), runs["End"].to_numpy(), boundaries)
+        # A run counts in the period it started in, even when it carries on into the next one
+        run_counts = np.diff(np.searchsorted(np.sort(runs["Started"].to_numpy()), boundaries, side="left"))
+        rows.append(pd.DataFrame({
+            "node_id": node_id, "Period": periods[:-1], "Runtime_Seconds": np.diff(on_time), "Runs": run_counts,
+        }))
+
+    usage = pd.concat(rows, ignore_index=True)
+    usage = usage.merge(node_settings(config, usage["node_id"].unique().tolist()), on="node_id")
+    usage["Runtime_Hours"] = usage.pop("Runtime_Seconds") / 3600
+    usage["Litres"] = usage["Runtime_Hours"] * 60 * usage.pop("Flow_Rate_Lpm")
+    usage = usage[usage["Runtime_Hours"] > 0]
+    return usage[["node_id", "Zone", "Client", "Period", "Runtime_Hours", "Litres", "Runs"]].reset_index(drop=True)
+
+
+# Monthly statements for every client: runtime, litres and run count per zone for the month
+def monthly_statements(store, config, month, now=None):
+    month_start = pd.Timestamp(month).normalize().replace(day=1)
+    month_end = month_start + pd.offsets.MonthBegin(1)
+    usage = pump_usage(store, config, month_start, month_end, freq="MS", now=now)
+    statements = usage.groupby(["Client", "Zone"], as_index=False)[["Runtime_Hours", "Litres", "Runs"]].sum()
+    statements.insert(0, "Month", month_start.strftime("%Y-%m"))
+    return statements.sort_values(["Client", "Zone"]).reset_index(drop=True)
+
+
+# Moisture response of each pump run: mean moisture in the window before it started, mean moisture
+# in the window after it stopped, and the change. Window means for all runs come from binary
+# searches into the node's stored history and its prefix sums.
+def run_moisture_response(store, intervals, before=RESPONSE_BEFORE, after=RESPONSE_AFTER):
+    responses = []
+    for node_id, runs in intervals.groupby("node_id"):
+        # The finest tier still holding the whole span
+        history = store.load(node_id, runs["Start"].min() - before, runs["End"].max() + after, max_points=np.inf)
+        if history.empty:
+            continue
+        readings = pd.DataFrame({
+            "ts": (history["Datetime"].dt.tz_localize(LOCAL_TZ) - pd.Timestamp(0, tz="UTC")).dt.total_seconds(),
+            "Moisture": history["Soil_Moisture_Level"],
+        }).dropna()
+        prefix = np.concatenate([[0.0], np.cumsum(readings["Moisture"].to_numpy())])
+        times = readings["ts"].to_numpy()
+
+        def window_mean(window_start, window_end):
+            i = np.searchsorted(times, window_start, side="left")
+            j = np.searchsorted(times, window_end, side="right")
+            with np.errstate(invalid="ignore", divide="ignore"):
+                return np.where(j > i, (prefix[j] - prefix[i]) / (j - i), np.nan)
+
+        starts, ends = runs["Start"].to_numpy(), runs["End"].to_numpy()
+        moisture_before = window_mean(starts - before, starts)
+        moisture_after = window_mean(ends, ends + after)
+        responses.append(pd.DataFrame({
+            "node_id": node_id,
+            "Start": epoch_to_datetime(pd.Series(starts)),
+            "Runtime_Minutes": (ends - starts) / 60,
+            "Moisture_Before": moisture_before,
+            "Moisture_After": moisture_after,
+            "Moisture_Change": moisture_after - moisture_before,
+        }))
+    if not responses:
+        return pd.DataFrame(columns=["node_id", "Start", "Runtime_Minutes", "Moisture_Before", "Moisture_After",
+                                     "Moisture_Change"])
+    return pd.concat(responses, ignore_index=True)
+
+
+# Print (and optionally save) monthly statements for every client, e.g.
+#   python pump_accounting.py --month 2026-10 --out statements_2026-10.csv
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SMART IRRI pump runtime and water usage statements")
+    parser.add_argument("--db", default=HISTORY_DB, help="Path to the sensor history database")
+    parser.add_argument("--config", default=PUMP_CONFIG_FILE, help="Pump zone/client/flow-rate configuration")
+    parser.add_argument("--month", default=time.strftime("%Y-%m"), help="Billing month (YYYY-MM)")
+    parser.add_argument("--out", help="Write the statements to this CSV file")
+    parser.add_argument("--responses", action="store_true", help="Also show each run's moisture response")
+    args = parser.parse_args()
+
+    store = HistoryStore(args.db)
+    started = time.perf_counter()
+    statements = monthly_statements(store, load_pump_config(args.config), args.month)
+    print(statements.to_string(index=False) if not statements.empty else f"No pump runs in {args.month}.")
+    print(f"Computed in {time.perf_counter() - started:.2f}s")
+
+    if args.out:
+        statements.to_csv(args.out, index=False)
+    if args.responses:
+        month_start = pd.Timestamp(args.month)
+        intervals = pump_intervals(store, month_start, month_start + pd.offsets.MonthBegin(1))
+        print(run_moisture_response(store, intervals).to_string(index=False))
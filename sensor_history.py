@@ -0,0 +1,420 @@
+import datetime
+import numbers
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+
+# Default location of the on-disk sensor history database (SMART_IRRI_HISTORY_DB overrides it)
+HISTORY_DB = os.environ.get("SMART_IRRI_HISTORY_DB", "sensor_history.db")
+
+# Rollup tiers, finest first: (name, bucket width in seconds, source tier)
+TIERS = [
+    ("raw", None, None),
+    ("minute", 60, "raw"),
+    ("hour", 3600, "minute"),
+    ("day", 86400, "hour"),
+]
+
+# How long each tier is kept, in seconds (None keeps the tier forever)
+RETENTION = {
+    "raw": 2 * 86400,
+    "minute": 30 * 86400,
+    "hour": 2 * 365 * 86400,
+    "day": None,
+}
+
+# Metrics stored per reading: (column in the raw table, prefix in the rollup tables)
+METRICS = [
+    ("soil_moisture", "moisture"),
+    ("temperature", "temperature"),
+    ("humidity", "humidity"),
+    ("raw_moisture", "raw_moisture"),
+]
+
+# Column names used by the analysis page and the PDF report
+ANALYSIS_COLUMNS = {
+    "moisture": "Soil_Moisture_Level",
+    "temperature": "Temperature",
+    "humidity": "Humidity",
+    "raw_moisture": "Raw_Soil_Moisture",
+}
+
+LOCAL_TZ = datetime.datetime.now().astimezone().tzinfo
+
+# Seconds east of UTC of the local timezone; rollup buckets are aligned to local minutes, hours and days
+LOCAL_OFFSET = int(datetime.datetime.now().astimezone().utcoffset().total_seconds())
+
+
+# Helper function to turn a datetime/date/Timestamp/epoch into epoch seconds
+def to_epoch(value):
+    if value is None:
+        return None
+    if isinstance(value, numbers.Real):
+        return float(value)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(LOCAL_TZ)
+    return timestamp.timestamp()
+
+
+# Helper function to turn an epoch column into local, timezone-naive datetimes
+def epoch_to_datetime(values):
+    return pd.to_datetime(values, unit="s", utc=True).dt.tz_convert(LOCAL_TZ).dt.tz_localize(None)
+
+
+def _tier_width(tier):
+    return {name: width for name, width, _ in TIERS}[tier]
+
+
+def _tier_source(tier):
+    return {name: source for name, _, source in TIERS}[tier]
+
+
+def _rollup_columns():
+    columns = []
+    for _, prefix in METRICS:
+        columns += [f"{prefix}_min", f"{prefix}_max", f"{prefix}_sum", f"{prefix}_count"]
+    return columns
+
+
+# Long-term sensor history: raw 1 Hz readings plus minute/hour/day rollups
+class HistoryStore:
+    def __init__(self, path=HISTORY_DB):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self._create_tables()
+        self.bucket_offset = self._load_bucket_offset()
+
+    def _create_tables(self):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS readings_raw ("
+                "node_id TEXT NOT NULL, ts REAL NOT NULL, "
+                "soil_moisture REAL, temperature REAL, humidity REAL, raw_moisture REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_raw ON readings_raw (node_id, ts)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_raw_ts ON readings_raw (ts)")
+            for tier, _, _ in TIERS[1:]:
+                columns = ", ".join(f"{column} REAL" for column in _rollup_columns())
+                self.conn.execute(
+                    f"CREATE TABLE IF NOT EXISTS readings_{tier} ("
+                    f"node_id TEXT NOT NULL, bucket INTEGER NOT NULL, {columns}, "
+                    f"PRIMARY KEY (node_id, bucket))"
+                )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS compaction_state (tier TEXT PRIMARY KEY, watermark REAL NOT NULL)"
+            )
+            # Pump status changes, written by the acquiring replica (SharedState.publish)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS pump_events (node_id TEXT NOT NULL, ts REAL NOT NULL, status TEXT NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pump_events ON pump_events (node_id, ts)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS history_settings (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+            self._add_missing_columns()
+
+    # The UTC offset buckets are aligned to, fixed when the database is created so rollups stay
+    # consistent if the server's timezone changes. Databases rolled up before this setting existed
+    # keep their UTC-aligned buckets.
+    def _load_bucket_offset(self):
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value FROM history_settings WHERE name = 'bucket_offset'").fetchone()
+            if row is not None:
+                return int(row[0])
+            compacted = self.conn.execute("SELECT COUNT(*) FROM compaction_state").fetchone()[0]
+            offset = 0 if compacted else LOCAL_OFFSET
+            self.conn.execute("INSERT INTO history_settings (name, value) VALUES ('bucket_offset', ?)", (offset,))
+            return offset
+
+    # Start of the local-time bucket of the given width that contains ts
+    def _align(self, ts, width):
+        return ((ts + self.bucket_offset) // width) * width - self.bucket_offset
+
+    # Bring databases created by older versions up to date with the current metric columns
+    def _add_missing_columns(self):
+        expected = {"readings_raw": [column for column, _ in METRICS]}
+        for tier, _, _ in TIERS[1:]:
+            expected[f"readings_{tier}"] = _rollup_columns()
+        for table, columns in expected.items():
+            existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for column in columns:
+                if column not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} REAL")
+
+    # Store one reading from a sensor node (raw_moisture is the uncalibrated probe value, if known)
+    def record(self, node_id, soil_moisture, temperature=None, humidity=None, ts=None, raw_moisture=None):
+        ts = time.time() if ts is None else to_epoch(ts)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO readings_raw (node_id, ts, soil_moisture, temperature, humidity, raw_moisture) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (node_id, ts, soil_moisture, temperature, humidity, raw_moisture),
+            )
+
+    # Current pump status of every node, with the time it last changed
+    def pump_status(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT node_id, MAX(ts), status FROM pump_events GROUP BY node_id ORDER BY node_id"
+            ).fetchall()
+        return [{"node_id": node_id, "since": ts, "status": status} for node_id, ts, status in rows]
+
+    # Most recent raw reading of every node
+    def latest(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT node_id, MAX(ts), soil_moisture, temperature, humidity FROM readings_raw "
+                "GROUP BY node_id ORDER BY node_id"
+            ).fetchall()
+        return [
+            {"node_id": node_id, "ts": ts, "soil_moisture": soil_moisture,
+             "temperature": temperature, "humidity": humidity}
+            for node_id, ts, soil_moisture, temperature, humidity in rows
+        ]
+
+    # Count stored readings rewritten in place (e.g. by re-calibration); call inside the writing transaction
+    def mark_edited(self):
+        self.conn.execute(
+            "INSERT INTO history_settings (name, value) VALUES ('edits', 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+        )
+
+    def _edits(self):
+        row = self.conn.execute("SELECT value FROM history_settings WHERE name = 'edits'").fetchone()
+        return 0 if row is None else row[0]
+
+    # Versions for cache validation, each changing only with the data a response depends on.
+    # A node's history up to `end`: its last reading before end, the compaction watermarks and edits.
+    def range_version(self, node_id, end):
+        with self.lock:
+            last = self.conn.execute(
+                "SELECT MAX(ts) FROM readings_raw WHERE node_id = ? AND ts < ?", (node_id, end)
+            ).fetchone()[0]
+            watermarks = self.conn.execute("SELECT tier, watermark FROM compaction_state ORDER BY tier").fetchall()
+            return last, tuple(watermarks), self._edits()
+
+    # Every node's latest reading: the newest raw row and edits
+    def latest_version(self):
+        with self.lock:
+            return self.conn.execute("SELECT MAX(rowid) FROM readings_raw").fetchone()[0], self._edits()
+
+    # Every node's pump status: the newest pump event
+    def pump_version(self):
+        with self.lock:
+            return self.conn.execute("SELECT MAX(rowid) FROM pump_events").fetchone()[0]
+
+    # List every node that has any stored history
+    def nodes(self):
+        with self.lock:
+            rows = self.conn.execute(
+                " UNION ".join(f"SELECT DISTINCT node_id FROM readings_{tier}" for tier, _, _ in TIERS)
+            ).fetchall()
+        return sorted(row[0] for row in rows)
+
+    # Earliest and latest timestamp stored for a node, across all tiers
+    def time_bounds(self, node_id):
+        lows, highs = [], []
+        with self.lock:
+            for tier, width, _ in TIERS:
+                column = "ts" if width is None else "bucket"
+                low, high = self.conn.execute(
+                    f"SELECT MIN({column}), MAX({column}) FROM readings_{tier} WHERE node_id = ?", (node_id,)
+                ).fetchone()
+                if low is not None:
+                    lows.append(low)
+                    highs.append(high + (width or 0))
+        if not lows:
+            return None, None
+        return min(lows), max(highs)
+
+    def _watermark(self, tier):
+        row = self.conn.execute("SELECT watermark FROM compaction_state WHERE tier = ?", (tier,)).fetchone()
+        return None if row is None else row[0]
+
+    def _source_start(self, source):
+        column = "ts" if source == "raw" else "bucket"
+        row = self.conn.execute(f"SELECT MIN({column}) FROM readings_{source}").fetchone()
+        return row[0]
+
+    # Roll one tier up from its source tier, for every bucket that is complete
+    def _roll_up(self, tier, now):
+        width = _tier_width(tier)
+        source = _tier_source(tier)
+        source_watermark = now if source == "raw" else self._watermark(source)
+        if source_watermark is None:
+            return 0
+        cutoff = self._align(min(now, source_watermark), width)
+
+        start = self._watermark(tier)
+        if start is None:
+            first = self._source_start(source)
+            if first is None:
+                return 0
+            start = self._align(first, width)
+        if cutoff <= start:
+            return 0
+
+        # Readings that arrive with a timestamp below the watermark are not rolled up again
+        if source == "raw":
+            time_column = "ts"
+            aggregates = []
+            for column, _ in METRICS:
+                aggregates += [f"MIN({column})", f"MAX({column})", f"SUM({column})", f"COUNT({column})"]
+        else:
+            time_column = "bucket"
+            aggregates = []
+            for _, prefix in METRICS:
+                aggregates += [f"MIN({prefix}_min)", f"MAX({prefix}_max)", f"SUM({prefix}_sum)", f"SUM({prefix}_count)"]
+
+        offset = self.bucket_offset
+        bucket = f"CAST(({time_column} + {offset}) / {width} AS INTEGER) * {width} - {offset}"
+        cursor = self.conn.execute(
+            f"INSERT OR REPLACE INTO readings_{tier} (node_id, bucket, {', '.join(_rollup_columns())}) "
+            f"SELECT node_id, {bucket} AS b, {', '.join(aggregates)} FROM readings_{source} "
+            f"WHERE {time_column} >= ? AND {time_column} < ? GROUP BY node_id, b",
+            (start, cutoff),
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO compaction_state (tier, watermark) VALUES (?, ?)", (tier, cutoff)
+        )
+        return cursor.rowcount
+
+    # Drop rows older than the tier's retention, but only once they have been rolled up
+    def _apply_retention(self, tier, now):
+        retention = RETENTION[tier]
+        if retention is None:
+            return 0
+        limit = now - retention
+        coarser = [name for name, _, source in TIERS if source == tier]
+        if coarser:
+            rolled_up_to = self._watermark(coarser[0])
+            if rolled_up_to is None:
+                return 0
+            limit = min(limit, rolled_up_to)
+        column = "ts" if tier == "raw" else "bucket"
+        cursor = self.conn.execute(f"DELETE FROM readings_{tier} WHERE {column} < ?", (limit,))
+        return cursor.rowcount
+
+    # Run one compaction pass: roll raw readings up into every tier, then apply retention
+    def compact(self, now=None):
+        now = time.time() if now is None else to_epoch(now)
+        summary = {}
+        with self.lock, self.conn:
+            for tier, width, _ in TIERS[1:]:
+                summary[tier] = self._roll_up(tier, now)
+            for tier, _, _ in TIERS:
+                summary[f"{tier}_deleted"] = self._apply_retention(tier, now)
+        return summary
+
+    # Pick the coarsest tier that still covers the range with enough points to chart it
+    def select_tier(self, start, end, max_points=2000, now=None):
+        now = time.time() if now is None else to_epoch(now)
+        start, end = to_epoch(start), to_epoch(end)
+        span = max(end - start, 1)
+        for tier, width, _ in TIERS:
+            retention = RETENTION[tier]
+            if retention is not None and start < now - retention:
+                continue
+            if span / (width or 1) <= max_points:
+                return tier
+        return TIERS[-1][0]
+
+    # Read one tier's rows for a node in [start, end) after `after`, with the time in a ts column
+    def _read_tier(self, tier, node_id, start, end, after, limit, overlap=False):
+        paging = "" if limit is None else f" LIMIT {int(limit)}"
+        if tier == "raw":
+            return pd.read_sql_query(
+                "SELECT ts, soil_moisture AS Soil_Moisture_Level, temperature AS Temperature, "
+                "humidity AS Humidity, raw_moisture AS Raw_Soil_Moisture FROM readings_raw "
+                "WHERE node_id = ? AND ts >= ? AND ts > ? AND ts < ? ORDER BY ts" + paging,
+                self.conn, params=(node_id, start, after, end),
+            )
+
+        # With overlap, the bucket that contains start is included too, not only those starting after it
+        lowest = start - _tier_width(tier) + 1 if overlap else start
+        data = pd.read_sql_query(
+            f"SELECT bucket AS ts, {', '.join(_rollup_columns())} FROM readings_{tier} "
+            f"WHERE node_id = ? AND bucket >= ? AND bucket > ? AND bucket < ? ORDER BY bucket{paging}",
+            self.conn, params=(node_id, lowest, after, end),
+        )
+        for _, prefix in METRICS:
+            name = ANALYSIS_COLUMNS[prefix]
+            counts = data[f"{prefix}_count"]
+            data[name] = data[f"{prefix}_sum"] / counts.where(counts > 0)
+            data[f"{name}_Min"] = data[f"{prefix}_min"]
+            data[f"{name}_Max"] = data[f"{prefix}_max"]
+        data["Count"] = data["moisture_count"].astype(int)
+        return data.drop(columns=_rollup_columns())
+
+    # Load a node's history between start and end, from the chosen (or automatically selected) tier.
+    # A rollup tier only holds buckets before its compaction watermark, so the rest of the range is
+    # filled from the next finer tiers, down to raw readings.
+    # With limit, at most that many rows are returned; pass after=<last epoch seen> to read the next page.
+    def load(self, node_id, start, end, tier=None, max_points=2000, limit=None, after=None):
+        start, end = to_epoch(start), to_epoch(end)
+        names = [name for name, _, _ in TIERS]
+        if tier is None:
+            tier = self.select_tier(start, end, max_points=max_points)
+        elif tier not in names:
+            raise ValueError(f"Unknown history tier: {tier}")
+        after = float("-inf") if after is None else after
+
+        pieces = []
+        piece_start = start
+        with self.lock:
+            for name in reversed(names[:names.index(tier) + 1]):
+                watermark = float("inf") if name == "raw" else self._watermark(name)
+                watermark = float("-inf") if watermark is None else watermark
+                piece_end = min(end, watermark)
+                if piece_end > piece_start:
+                    piece = self._read_tier(name, node_id, piece_start, piece_end, after, limit,
+                                            overlap=piece_start == start)
+                    if name == "raw" and tier != "raw":
+                        # Each raw reading stands for itself among the rolled-up rows
+                        for _, prefix in METRICS:
+                            column = ANALYSIS_COLUMNS[prefix]
+                            piece[f"{column}_Min"] = piece[column]
+                            piece[f"{column}_Max"] = piece[column]
+                        piece["Count"] = piece["Soil_Moisture_Level"].notna().astype(int)
+                    pieces.append(piece)
+                piece_start = max(piece_start, watermark)
+                if piece_start >= end:
+                    break
+            if not pieces:
+                pieces = [self._read_tier(tier, node_id, start, start, after, limit)]  # Empty, with the tier's columns
+
+        pieces = [piece for piece in pieces if len(piece)] or pieces[:1]
+        data = pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0]
+        if limit is not None:
+            data = data.head(int(limit))
+
+        last_ts = float(data["ts"].iloc[-1]) if len(data) else None
+        data.insert(0, "Datetime", epoch_to_datetime(data["ts"]))
+        data = data.drop(columns=["ts"])
+        data.attrs["tier"] = tier
+        data.attrs["last_ts"] = last_ts
+        return data
+
+
+# Start a background thread that compacts the history store periodically
+def start_compaction_worker(store, interval=60):
+    stop_event = threading.Event()
+
+    def run():
+        while not stop_event.is_set():
+            try:
+                store.compact()
+            except sqlite3.Error:
+                pass  # Try again on the next pass (e.g. database busy)
+            stop_event.wait(interval)
+
+    worker = threading.Thread(target=run, name="history-compaction", daemon=True)
+    worker.start()
+    return stop_event
@@ -0,0 +1,257 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+from fleet_health import SAMPLE_WINDOW, SUMMARY_COLUMNS
+
+
+# Seconds a leader's lease lasts without renewal before another replica may take over. A separate
+# thread renews it every LEASE_TTL / 3 while the acquisition loop keeps making progress, so a round
+# blocked on a sensor timeout (up to two 5 s timeouts: connect and read) does not lose the lease.
+LEASE_TTL = 15.0
+
+# How often a replica refreshes its in-process copy of the shared state
+REFRESH_INTERVAL = 0.5
+
+
+# Helper function to make an identifier that is unique per app process
+def make_replica_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+# State shared by every app replica on this host, kept in the sensor history database:
+# - a lease table used to elect the one replica that polls the hardware and actuates the pump
+# - the current reading and pump status of every node, published by that leader
+# - the leader's per-node request health, for every replica's Fleet Health page: a summary row per
+#   node, plus its latency histogram and recent samples, which are only read for the node inspected
+# Readers get the state from an in-process copy refreshed at most every REFRESH_INTERVAL, so a
+# replica issues one small query per interval however many sessions it serves; with SQLite in WAL
+# mode those reads never block each other or the leader, and read capacity grows with replicas.
+class SharedState:
+    def __init__(self, store, replica_id=None, lease_ttl=LEASE_TTL, refresh_interval=REFRESH_INTERVAL):
+        self.store = store
+        self.replica_id = replica_id or make_replica_id()
+        self.lease_ttl = lease_ttl
+        self.refresh_interval = refresh_interval
+        self.cache = {}
+        self.cache_time = 0.0
+        self.cache_lock = threading.Lock()
+        self.fleet_published = {}  # node_id -> its request count when this replica last published it
+        with store.lock, store.conn:
+            store.conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            store.conn.execute("DROP TABLE IF EXISTS fleet_stats")  # Whole-state JSON rows of older versions
+            store.conn.execute(
+                "CREATE TABLE IF NOT EXISTS fleet_summary ("
+                "node_id TEXT PRIMARY KEY, requests INTEGER, failure_rate REAL, last_seen REAL, moisture_mean REAL, "
+                "moisture_variance REAL, latency_p50_ms REAL, latency_p99_ms REAL, histogram TEXT, ts REAL NOT NULL)"
+            )
+            store.conn.execute(
+                "CREATE TABLE IF NOT EXISTS fleet_samples ("
+                "node_id TEXT NOT NULL, ts REAL NOT NULL, soil_moisture REAL, latency REAL, ok INTEGER)"
+            )
+            store.conn.execute("CREATE INDEX IF NOT EXISTS fleet_samples_node ON fleet_samples (node_id)")
+            store.conn.execute(
+                "CREATE TABLE IF NOT EXISTS current_state ("
+                "node_id TEXT PRIMARY KEY, ts REAL NOT NULL, soil_moisture REAL, temperature REAL, humidity REAL, "
+                "pump_status TEXT, pump_since REAL, leader TEXT)"
+            )
+
+    # Run the block in a write transaction that excludes every other replica's writes
+    @contextmanager
+    def _immediate(self):
+        conn = self.store.conn
+        with self.store.lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    # Whether this replica holds an unexpired lease (called inside a transaction)
+    def _holds(self, conn, name, now):
+        row = conn.execute("SELECT holder, expires FROM leases WHERE name = ?", (name,)).fetchone()
+        return row is not None and row[0] == self.replica_id and row[1] >= now
+
+    # Take or renew the named lease; True while this replica holds it
+    def try_acquire(self, name="acquisition", now=None):
+        now = time.time() if now is None else now
+        try:
+            with self._immediate() as conn:  # Serialize elections across processes
+                row = conn.execute("SELECT holder, expires FROM leases WHERE name = ?", (name,)).fetchone()
+                acquired = row is None or row[0] == self.replica_id or row[1] < now
+                if acquired and (row is None or row[0] != self.replica_id):
+                    self.fleet_published = {}  # Taking over: publish every node's health afresh
+                if acquired:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO leases (name, holder, expires) VALUES (?, ?, ?)",
+                        (name, self.replica_id, now + self.lease_ttl),
+                    )
+        except sqlite3.OperationalError:
+            return False  # Database busy: try again on the next round
+        return acquired
+
+    # Extend the lease only if this replica still holds it; never takes it over
+    def renew(self, name="acquisition", now=None):
+        now = time.time() if now is None else now
+        try:
+            with self._immediate() as conn:
+                if not self._holds(conn, name, now):
+                    return False
+                conn.execute("UPDATE leases SET expires = ? WHERE name = ?", (now + self.lease_ttl, name))
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    # Give the lease up (e.g. on shutdown) so another replica can take over at once
+    def release(self, name="acquisition"):
+        with self.store.lock, self.store.conn:
+            self.store.conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, self.replica_id))
+
+    # Replica currently holding the lease, or None
+    def leader(self, name="acquisition", now=None):
+        now = time.time() if now is None else now
+        with self.store.lock:
+            row = self.store.conn.execute("SELECT holder, expires FROM leases WHERE name = ?", (name,)).fetchone()
+        return row[0] if row is not None and row[1] >= now else None
+
+    # Record a node's pump status change and publish its latest reading, but only while this replica
+    # holds the lease: the check and the writes share one transaction, so a leader that lost the lease
+    # mid-round (e.g. while blocked on the sensor) cannot actuate. Returns False when fenced off.
+    def publish(self, node_id, reading, pump_status, now=None, name="acquisition"):
+        now = time.time() if now is None else now
+        with self._immediate() as conn:
+            if not self._holds(conn, name, now):
+                return False
+            last = conn.execute(
+                "SELECT status FROM pump_events WHERE node_id = ? ORDER BY ts DESC LIMIT 1", (node_id,)
+            ).fetchone()
+            if last is None or last[0] != pump_status:
+                conn.execute("INSERT INTO pump_events (node_id, ts, status) VALUES (?, ?, ?)",
+                             (node_id, now, pump_status))
+
+            row = conn.execute(
+                "SELECT pump_status, pump_since FROM current_state WHERE node_id = ?", (node_id,)
+            ).fetchone()
+            pump_since = row[1] if row is not None and row[0] == pump_status else now
+            conn.execute(
+                "INSERT OR REPLACE INTO current_state "
+                "(node_id, ts, soil_moisture, temperature, humidity, pump_status, pump_since, leader) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (node_id, now, reading.get('soil_moisture'), reading.get('temperature'), reading.get('humidity'),
+                 pump_status, pump_since, self.replica_id),
+            )
+        return True
+
+    # Publish per-node request health from a FleetMonitor so every replica's Fleet Health page sees it.
+    # Only nodes polled since the last publish are written, and only the samples added since then.
+    def publish_fleet(self, monitor, now=None, name="acquisition"):
+        now = time.time() if now is None else now
+        changes = monitor.changes(self.fleet_published)
+        if not changes:
+            return True
+        summaries = [change['summary'] for change in changes.values()]
+        with self._immediate() as conn:
+            if not self._holds(conn, name, now):
+                return False
+            conn.executemany(
+                "INSERT OR REPLACE INTO fleet_summary (node_id, requests, failure_rate, last_seen, moisture_mean, "
+                "moisture_variance, latency_p50_ms, latency_p99_ms, histogram, ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(row['Node'], row['Requests'], row['Failure_Rate'], row['Last_Seen'], row['Moisture_Mean'],
+                  row['Moisture_Variance'], row['Latency_p50_ms'], row['Latency_p99_ms'],
+                  json.dumps(change['histogram']), now) for row, change in zip(summaries, changes.values())],
+            )
+            conn.executemany(
+                "INSERT INTO fleet_samples (node_id, ts, soil_moisture, latency, ok) VALUES (?, ?, ?, ?, ?)",
+                [(node_id,) + tuple(sample) for node_id, change in changes.items() for sample in change['samples']],
+            )
+            # Keep the last SAMPLE_WINDOW samples per node
+            conn.executemany(
+                "DELETE FROM fleet_samples WHERE node_id = ? AND rowid <= "
+                "(SELECT rowid FROM fleet_samples WHERE node_id = ? ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+                [(node_id, node_id, SAMPLE_WINDOW) for node_id in changes],
+            )
+        self.fleet_published.update({node_id: change['requests'] for node_id, change in changes.items()})
+        return True
+
+    # The published per-node health summaries (see fleet_health.fleet_status)
+    def fleet(self):
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                "SELECT node_id, requests, failure_rate, last_seen, moisture_mean, moisture_variance, "
+                "latency_p50_ms, latency_p99_ms FROM fleet_summary"
+            ).fetchall()
+        return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+    # A node's published recent samples, oldest first, as (ts, moisture, latency, ok) rows
+    def fleet_samples(self, node_id):
+        with self.store.lock:
+            rows = self.store.conn.execute(
+                "SELECT ts, soil_moisture, latency, ok FROM fleet_samples WHERE node_id = ? ORDER BY rowid", (node_id,)
+            ).fetchall()
+        return [(ts, moisture, latency, bool(ok)) for ts, moisture, latency, ok in rows]
+
+    # A node's published latency histogram counts, or None if nothing has been published for it
+    def fleet_histogram(self, node_id):
+        with self.store.lock:
+            row = self.store.conn.execute("SELECT histogram FROM fleet_summary WHERE node_id = ?", (node_id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    # Current state of every node, as {node_id: {...}}, from the in-process copy
+    def snapshot(self):
+        now = time.time()
+        if now - self.cache_time >= self.refresh_interval:
+            with self.cache_lock:
+                # Another session in this process may have refreshed it while we waited
+                if now - self.cache_time >= self.refresh_interval:
+                    with self.store.lock:
+                        cursor = self.store.conn.execute("SELECT * FROM current_state")
+                        columns = [column[0] for column in cursor.description]
+                        rows = cursor.fetchall()
+                    self.cache = {row[0]: dict(zip(columns, row)) for row in rows}
+                    self.cache_time = now
+        return self.cache
+
+    # Current state of one node, or None if nothing has been published for it
+    def current(self, node_id):
+        return self.snapshot().get(node_id)
+
+
+# Start the acquisition loop in a background thread: every interval, each replica tries to take the
+# lease and only the holder runs `step` (poll the hardware, decide and publish the pump status).
+# A second thread renews the lease while rounds keep completing; if the loop stalls for a whole
+# lease TTL the lease lapses and another replica takes over.
+def start_acquisition(shared, step, interval=1.0):
+    stop_event = threading.Event()
+    progress = {'at': time.monotonic()}
+
+    def run():
+        while not stop_event.is_set():
+            started = progress['at'] = time.monotonic()
+            if shared.try_acquire():
+                try:
+                    step()
+                except Exception:
+                    pass  # A failed round must not kill the loop; the next one retries
+            progress['at'] = time.monotonic()
+            stop_event.wait(max(0.0, interval - (time.monotonic() - started)))
+        shared.release()
+
+    def renew():
+        while not stop_event.wait(shared.lease_ttl / 3):
+            if time.monotonic() - progress['at'] < shared.lease_ttl:
+                shared.renew()
+
+    threading.Thread(target=run, name="acquisition", daemon=True).start()
+    threading.Thread(target=renew, name="acquisition-lease", daemon=True).start()
+    return stop_event